@@ -1,29 +1,63 @@
-from .core.ionization import Ionization as ion
-from .core.spectrum import EmissionSpectrum as emm
-from .core.download_database import download_emission_data, download_ionization_data, download_all, initialize_data, hash_all
-from .core.utils import CHECK_OR_DOWNLOAD_APLASMA_DATA
+from importlib import import_module
+from typing import Any, List
 
-try:
-    Ionization = ion()
-except (FileNotFoundError,):
-    if CHECK_OR_DOWNLOAD_APLASMA_DATA:
-        print("Ionization data unavailable!")
-        print("Trying to download just one ionization data file for initialization ...")
-        initialize_data("ionization")
-        try:
-            Ionization = ion()
-        except Exception as e:
-            print("Error downloading ionization file!")
-            print(e)
-try:
-    EmissionSpectrum = emm()
-except (FileNotFoundError,):
-    if CHECK_OR_DOWNLOAD_APLASMA_DATA:
-        print("Emission data unavailable!")
-        print("Trying to download just one emission data file for initialization ...")
-        initialize_data("emission")
+# Everything is resolved on first use (PEP 562): importing the package neither
+# loads the heavy dependencies nor touches the data files or the network.
+_LAZY_IMPORTS = {
+    "ion": (".core.ionization", "Ionization"),
+    "emm": (".core.spectrum", "EmissionSpectrum"),
+    "download_emission_data": (".core.download_database", "download_emission_data"),
+    "download_ionization_data": (".core.download_database", "download_ionization_data"),
+    "download_all": (".core.download_database", "download_all"),
+    "initialize_data": (".core.download_database", "initialize_data"),
+    "hash_all": (".core.download_database", "hash_all"),
+    "write_manifest": (".core.manifest", "write_manifest"),
+    "pack_table": (".core.table_store", "pack_table"),
+    "retile_table": (".core.tiles", "retile_table"),
+    "CHECK_OR_DOWNLOAD_APLASMA_DATA": (".core.utils", "CHECK_OR_DOWNLOAD_APLASMA_DATA"),
+}
+# default tables built on first use: (class, name of the data)
+_SINGLETONS = {
+    "Ionization": ("ion", "ionization"),
+    "EmissionSpectrum": ("emm", "emission"),
+}
+
+
+def _load_singleton(name: str) -> Any:
+    table, data_name = _SINGLETONS[name]
+    try:
+        return __getattr__(table)()
+    except (FileNotFoundError,) as error:
+        if not __getattr__("CHECK_OR_DOWNLOAD_APLASMA_DATA"):
+            raise AttributeError(f"{name} data unavailable!") from error
+        print(f"{data_name.capitalize()} data unavailable!")
+        print(f"Trying to download just one {data_name} data file for initialization ...")
+        __getattr__("initialize_data")(data_name)
         try:
-            EmissionSpectrum = emm()
-        except Exception as e:
-            print("Error downloading emission file!")
-            print(e)
+            return __getattr__(table)()
+        except Exception as error:
+            print(f"Error downloading {data_name} file!")
+            print(error)
+            raise AttributeError(f"{name} data unavailable!") from error
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_IMPORTS:
+        module, attribute = _LAZY_IMPORTS[name]
+        value = getattr(import_module(module, __name__), attribute)
+    elif name in _SINGLETONS:
+        value = _load_singleton(name)
+    elif name == "core":
+        # the modules that used to be imported with the package
+        for module in ("ionization", "spectrum", "download_database"):
+            import_module(f".core.{module}", __name__)
+        value = import_module(".core", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # later lookups find it directly in the module
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted({*globals(), *_LAZY_IMPORTS, *_SINGLETONS, "core"})
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+
+
+class BatchCache:
+    def __init__(
+        self: "BatchCache",
+        max_bytes: int = 0,
+    ) -> None:
+        """
+        In-memory cache of decoded datasets from the batch files.
+        Entries are evicted least recently used first once the
+        total size exceeds max_bytes.
+
+        Parameters
+        ----------
+        max_bytes : int, optional
+            memory budget of the cache in bytes.
+            The default is 0 (caching disabled).
+
+        Returns
+        -------
+        None.
+
+        """
+        self._arrays: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.max_bytes = max_bytes
+
+    @property
+    def max_bytes(self: "BatchCache") -> int:
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self: "BatchCache", max_bytes: int) -> None:
+        if max_bytes < 0:
+            raise ValueError(f"Problem! Invalid cache size {max_bytes} bytes.")
+        self._max_bytes = int(max_bytes)
+        self._evict()
+
+    def fits(self: "BatchCache", nbytes: int) -> bool:
+        """
+        Check if an array of nbytes can be held by the cache at all.
+        """
+        return 0 < nbytes <= self._max_bytes
+
+    def get(self: "BatchCache", key: Hashable) -> Optional[np.ndarray]:
+        """
+        Cached array for the key (read-only), None if not cached.
+        """
+        array = self._arrays.get(key)
+        if array is None:
+            self.misses += 1
+            return None
+        self._arrays.move_to_end(key)
+        self.hits += 1
+        return array
+
+    def put(self: "BatchCache", key: Hashable, array: np.ndarray) -> None:
+        """
+        Add an array to the cache, evicting old entries if needed.
+        Arrays larger than the whole budget are not cached.
+        """
+        if not self.fits(array.nbytes):
+            return
+        if key in self._arrays:
+            self.nbytes -= self._arrays.pop(key).nbytes
+        array.flags.writeable = False
+        self._arrays[key] = array
+        self.nbytes += array.nbytes
+        self._evict()
+
+    def _evict(self: "BatchCache") -> None:
+        while self.nbytes > self._max_bytes and len(self._arrays) > 0:
+            _, array = self._arrays.popitem(last=False)
+            self.nbytes -= array.nbytes
+            self.evictions += 1
+
+    def clear(self: "BatchCache") -> None:
+        """
+        Drop all the cached arrays. Counters are kept.
+        """
+        self._arrays.clear()
+        self.nbytes = 0
+
+    def stats(self: "BatchCache") -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._arrays),
+            "nbytes": self.nbytes,
+            "max_bytes": self._max_bytes,
+        }
+
+    def __contains__(self: "BatchCache", key: Hashable) -> bool:
+        return key in self._arrays
+
+    def __len__(self: "BatchCache") -> int:
+        return len(self._arrays)
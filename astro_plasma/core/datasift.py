@@ -6,30 +6,151 @@ Created on Tue Apr  4 21:30:23 2023
 """
 
 from abc import ABC, abstractmethod
-import numpy as np
+from bisect import bisect_left
 from itertools import product
+import math
+import numpy as np
 from pathlib import Path
-from typing import Protocol, Callable, Optional, Union, Tuple, List, Set
+from typing import Protocol, Callable, Optional, Union, Tuple, List, Dict, Sequence
 import h5py
-import sys
 from .utils import should_check_or_download_data
+from .file_pool import FilePool, MAX_OPEN_FILES
+from .batch_cache import BatchCache
+from .manifest import Manifest
+from .table_store import open_store
+from .tiles import tile_layout, tile_origin
 
 _warn = False
+# upper limit on the size of the (points, corners, columns) work arrays
+_BLOCK_BYTES = 64 * 1024**2
+# upper limit on the table rows of a query read ahead in batch-major order
+_PREFETCH_BYTES = 512 * 1024**2
+# distance given to the stencil corners that coincide with the requested point
+_EPSILON = 1e-15
+
+
+def _uniform_spacing(axis_data: np.ndarray) -> Optional[Tuple[str, float, float]]:
+    """
+    Detect grids generated with np.linspace or np.logspace.
+
+    Returns
+    -------
+    spacing : tuple or None
+        (scale, start, step) with scale either "linear" or "log" (log10),
+        None if the grid is not uniform in either of these.
+    """
+    if axis_data.shape[0] < 2 or np.any(np.diff(axis_data) <= 0):
+        return None
+    candidates = [("linear", axis_data)]
+    if np.all(axis_data > 0):
+        candidates.append(("log", np.log10(axis_data)))
+    for scale, nodes in candidates:
+        step = (nodes[-1] - nodes[0]) / (nodes.shape[0] - 1)
+        if np.allclose(np.diff(nodes), step, rtol=1e-6, atol=0.0):
+            return (scale, float(nodes[0]), float(step))
+    return None
+
+
+def _scalar_stencil(axis: List[float], value: float) -> List[int]:
+    """
+    Neighbouring grid nodes of a single value along an axis (as a list),
+    like `DataSift._stencil_positions` with plain floats: 3 nodes when
+    the value sits on a grid node, otherwise 2, clamped to the grid.
+    """
+    n_nodes = len(axis)
+    above = bisect_left(axis, value)
+    if above < n_nodes and axis[above] == value:
+        positions = [above - 1, above, above + 1]
+    else:
+        positions = [above - 1, above]
+    if _warn and (positions[0] < 0 or positions[-1] >= n_nodes):
+        print("Problem: requested value at the edge of the table")
+    return [min(max(position, 0), n_nodes - 1) for position in positions]
+
+
+def _scalar_linear_factors(axis: List[float], value: float, positions: List[int], log_scale: bool) -> List[Tuple[int, float]]:
+    # lower and upper node of a single value with their linear weight, like `DataSift._linear_weights`
+    lower, upper = positions[0], positions[1]
+    if log_scale:
+        node_lower, node_upper, value = math.log10(axis[lower]), math.log10(axis[upper]), math.log10(value)
+    else:
+        node_lower, node_upper = axis[lower], axis[upper]
+    span = node_upper - node_lower
+    weight = min(max((value - node_lower) / span, 0.0), 1.0) if span > 0 else 0.0
+    return [(lower, 1.0 - weight), (upper, weight)]
+
+
+def _idw_average(all_values: np.ndarray, corner_dist_sq: np.ndarray) -> np.ndarray:
+    """
+    Inverse distance weighted average over the stencil corners of a block of points.
+
+    Parameters
+    ----------
+    all_values : np.ndarray
+        table values at the corners (cut applied) of shape (points, corners, columns).
+        The outliers are set to zero in place.
+    corner_dist_sq : np.ndarray
+        squared distance of the corners from the points of shape (points, corners).
+
+    Returns
+    -------
+    interp_value : np.ndarray
+        Interpolated values of shape (points, columns).
+    """
+    distL2 = np.sqrt(corner_dist_sq)
+    distL2[distL2 <= 0.0] = _EPSILON
+    all_weights = 1 / distL2
+
+    # Filter the outliers (deviation from mean across column is large)
+    all_values[(np.abs(all_values - np.mean(all_values, axis=1, keepdims=True)) > 2.0 * np.std(all_values, axis=1, keepdims=True))] = 0.0
+    return (all_weights[:, np.newaxis, :] @ all_values)[:, 0, :] / np.sum(all_weights, axis=1)[:, np.newaxis]
+
+
+def _idw_average_floats(values: List[float], corner_dist_sq: List[float]) -> float:
+    # `_idw_average` of a single point and a single column with plain floats (cheaper than numpy)
+    weights = []
+    for dist_sq in corner_dist_sq:
+        distance = math.sqrt(dist_sq)
+        weights.append(1 / (distance if distance > 0.0 else _EPSILON))
+    mean = sum(values) / len(values)
+    spread = 2.0 * math.sqrt(sum([(value - mean) ** 2 for value in values]) / len(values))
+    values = [0.0 if abs(value - mean) > spread else value for value in values]
+    return sum([weight * value for weight, value in zip(weights, values)]) / sum(weights)
+
+
+def _linear_average(all_values: np.ndarray, all_weights: np.ndarray) -> np.ndarray:
+    # values at the corners (points, corners, columns) summed with their linear weights (points, corners)
+    return (all_weights[:, np.newaxis, :] @ all_values)[:, 0, :]
+
+
+def _point_buffer(out: Optional[np.ndarray], n_points: int, n_columns: int) -> Optional[np.ndarray]:
+    # out as a (points, columns) view the interpolation writes into,
+    # None if its memory is not laid out that way (results copied into it afterwards)
+    if out is None or not out.flags.c_contiguous or out.size != n_points * n_columns:
+        return None
+    return out.reshape(n_points, n_columns)
 
 
 class inherited_from_DataSift(Protocol):
     # This must be compulsorily implemented by any class inheriting from DataSift
     _check_and_download: Callable
+    batch_cache: BatchCache
 
 
 class DataSift(ABC):
+    batch_cache: BatchCache
+    # read all the table rows needed by a query batch by batch (each batch file
+    # once, rows in sorted order) before interpolating, when they fit in memory
+    batch_major: bool = True
+
     def __init__(
         self: "DataSift",
         child_obj: "inherited_from_DataSift",
-        data: h5py.File,
+        data: Union[h5py.File, Manifest],
     ) -> None:
         """
-        Prepares the location to read data for interpolation.
+        Prepares the location to read data for interpolation,
+        from the file of batch 0 or from the manifest of the table.
 
         Returns
         -------
@@ -43,13 +164,82 @@ class DataSift(ABC):
 
         self.batch_size = np.prod(data["header/batch_dim"][()])
         self.total_size = np.prod(data["header/total_size"][()])
+        # tiled tables (from `retile_table`): the batches are 4-D blocks of the grid with a halo
+        self._grid = (self.nH_data.shape[0], self.T_data.shape[0], self.Z_data.shape[0], self.red_data.shape[0])
+        self._tiles = tile_layout(self._grid, data["header/tile_dim"][()]) if "header/tile_dim" in data else None
+        if self._tiles is not None and np.prod(self._tiles[1]) != self.batch_size:
+            raise ValueError("Problem! The tiles do not match the size of the batches.")
         self._check_and_download = child_obj._check_and_download
 
-    def _identify_batch(self: "DataSift", i: int, j: int, k: int, m: int) -> int:
-        batch_id = self._get_counter(i, j, k, m) // self.batch_size
+        # batch files stay open across queries, new location means new files
+        previous_pool: Optional[FilePool] = getattr(self, "_file_pool", None)
+        if previous_pool is not None:
+            previous_pool.close()
+        self._file_pool = FilePool(self._get_file_path, self.max_open_files)
+        self._columns_per_node: Dict[str, int] = {}
+        self._manifest = data if isinstance(data, Manifest) else None
+        if self._manifest is not None:
+            # layout of the datasets known without opening any batch file
+            self._columns_per_node = {name: self._manifest.n_columns(name) for name in self._manifest.datasets}
+        # name of the table in the keys of the batch cache
+        self._table_name = str(Path(self._get_file_path(0)).parent)
+        # memory-mapped stores of the datasets (None for datasets read from the batch files)
+        self._stores: Dict[str, Optional[np.ndarray]] = {}
+
+        self._axes = (self.nH_data, self.T_data, self.Z_data, self.red_data)
+        self._axis_spacing = [_uniform_spacing(axis) for axis in self._axes]
+        # parameter space of every axis for linear interpolation
+        self._axis_scale = [
+            spacing[0] if spacing is not None else ("log" if np.all(axis > 0) else "linear") for axis, spacing in zip(self._axes, self._axis_spacing)
+        ]
+        # plain float copies of the axes for the queries of a single point
+        self._axis_lists = [axis.tolist() for axis in self._axes]
+
+    @property
+    def max_open_files(self: "DataSift") -> int:
+        return getattr(self, "_max_open_files", MAX_OPEN_FILES)
+
+    @max_open_files.setter
+    def max_open_files(self: "DataSift", max_open_files: int) -> None:
+        if getattr(self, "_file_pool", None) is not None:
+            self._file_pool.max_open = max_open_files
+        self._max_open_files = int(max_open_files)
+
+    def close(self: "DataSift") -> None:
+        """
+        Close all the batch files kept open by previous queries.
+        They are opened again on demand by later queries.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._file_pool.close()
+
+    def __enter__(self: "DataSift") -> "DataSift":
+        return self
+
+    def __exit__(self: "DataSift", *args) -> None:
+        self.close()
+
+    def _identify_batch(
+        self: "DataSift",
+        i: Union[int, np.ndarray],
+        j: Union[int, np.ndarray],
+        k: Union[int, np.ndarray],
+        m: Union[int, np.ndarray],
+    ) -> Union[int, np.ndarray]:
+        batch_id = self._locate_nodes(self._get_counter(i, j, k, m))[0]
         return batch_id
 
-    def _get_counter(self: "DataSift", i: int, j: int, k: int, m: int) -> int:
+    def _get_counter(
+        self: "DataSift",
+        i: Union[int, np.ndarray],
+        j: Union[int, np.ndarray],
+        k: Union[int, np.ndarray],
+        m: Union[int, np.ndarray],
+    ) -> Union[int, np.ndarray]:
         counter = (
             (m) * self.Z_data.shape[0] * self.T_data.shape[0] * self.nH_data.shape[0]
             + (k) * self.T_data.shape[0] * self.nH_data.shape[0]
@@ -130,13 +320,13 @@ class DataSift(ABC):
 
         _dummy_array = [False, False, False, False]  # array to flag which arguments are length 1 array
         if _array_argument[0]:
-            _dummy_array[0] = np.array(nH).shape[0] == 1
+            _dummy_array[0] = np.array(nH).size == 1
         if _array_argument[1]:
-            _dummy_array[1] = np.array(temperature).shape[0] == 1
+            _dummy_array[1] = np.array(temperature).size == 1
         if _array_argument[2]:
-            _dummy_array[2] = np.array(metallicity).shape[0] == 1
+            _dummy_array[2] = np.array(metallicity).size == 1
         if _array_argument[3]:
-            _dummy_array[3] = np.array(redshift).shape[0] == 1
+            _dummy_array[3] = np.array(redshift).size == 1
 
         return (_array_argument, _dummy_array)
 
@@ -148,9 +338,10 @@ class DataSift(ABC):
         redshift: Union[int, float, List, np.ndarray],
         _array_argument: List[bool],
         _dummy_array: List[bool],
-    ) -> Tuple[Optional[Tuple[int]], List[np.ndarray]]:
+    ) -> Tuple[Tuple[int, ...], List[np.ndarray]]:
         """
-        Determine if multiple datapoints are requested.
+        Determine the shape of the requested data from the broadcasting
+        of all the arguments.
 
         Parameters
         ----------
@@ -166,206 +357,109 @@ class DataSift(ABC):
         Returns
         -------
         input data tuple : tuple
-            prepared input data.
-
-        """
-        _input_shape: Optional[Tuple[int]] = None
-        argument_collection = [np.array(nH), np.array(temperature), np.array(metallicity), np.array(redshift)]
-        for indx, _if_this_is_arr in enumerate(_array_argument):
-            if not (_if_this_is_arr):
-                argument_collection[indx] = np.array(
-                    [
-                        argument_collection[indx],
-                    ]
-                )
-            else:
-                if _input_shape is None:
-                    _input_shape = argument_collection[indx].shape
-                else:
-                    if _input_shape != argument_collection[indx].shape:
-                        print("Error: ", argument_collection[indx].shape, _input_shape)
-                        print("Argument: ", argument_collection[indx])
-                        raise ValueError("Check needed from user: Invalid input arguments which are not in compliance with each other! Code Aborted!")
-            argument_collection[indx] = argument_collection[indx].flatten()
+            shape of the requested data and
+            all the arguments as float arrays (not broadcasted).
+
+        """
+        argument_collection = [np.array(argument, dtype=np.float64) for argument in (nH, temperature, metallicity, redshift)]
+        # arguments follow the broadcasting rules of numpy
+        try:
+            _input_shape: Tuple[int, ...] = np.broadcast_shapes(*[argument.shape for argument in argument_collection])
+        except ValueError:
+            print("Error: ", [argument.shape for argument in argument_collection])
+            raise ValueError("Check needed from user: Invalid input arguments which are not in compliance with each other! Code Aborted!")
         if np.sum(_dummy_array) == 4 or np.sum(_array_argument) == 0:
             _input_shape = (1,)  # default only one datapoint is requested
-        if _input_shape is None:
-            raise ValueError("Check needed from user: Invalid input arguments which are not in compliance with each other! Code Aborted!")
         return (_input_shape, argument_collection)
 
-    def _find_all_batches(
+    def _stencil_nodes(
         self: "DataSift",
-        nH: Union[int, float, List, np.ndarray],
-        temperature: Union[int, float, List, np.ndarray],
-        metallicity: Union[int, float, List, np.ndarray],
-        redshift: Union[int, float, List, np.ndarray],
-    ) -> Set[int]:
+        stencils: List[Tuple[np.ndarray, np.ndarray]],
+        point_index: Optional[List[np.ndarray]] = None,
+    ) -> np.ndarray:
         """
-        Determine if multiple datapoints are requested.
+        Grid nodes used by the stencils of all the requested points.
 
         Parameters
         ----------
-        nH : float
-            Hydrogen number density (all hydrogen both neutral and ionized.
-        temperature : float, array, list
-            Plasma temperature.
-        metallicity : float, array, list
-            Plasma metallicity with respect to solar.
-        redshift : float, array, list
-            Cosmological redshift of the universe.
+        stencils : list of (np.ndarray, np.ndarray)
+            neighbouring grid indices along each axis
+            for every value (from `_stencil_positions`).
+        point_index : list of np.ndarray, optional
+            position of every point in the values along each axis.
+            The default is None (one value per point).
 
         Returns
         -------
-        batch_ids : set
-            Set of all the unique batch ids from the entire requested data.
-
+        nodes : np.ndarray
+            sorted unique counters (flat position in the table) of the nodes.
         """
+        positions = [stencil[0] for stencil in stencils]
+        if point_index is None:
+            point_index = [np.arange(positions[0].shape[0])] * 4
+        # points with the same neighbours along every axis share all their nodes,
+        # neighbours along an axis are coded by the middle one and the two gaps (0 or 1)
+        stencil_key = np.zeros(point_index[0].shape[0], dtype=np.int64)
+        for position, index, axis_data in zip(positions, point_index, self._axes):
+            code = 4 * position[:, 1] + 2 * (position[:, 1] - position[:, 0]) + (position[:, 2] - position[:, 1])
+            stencil_key = stencil_key * (4 * axis_data.shape[0]) + code[index]
+        _, distinct = np.unique(stencil_key, return_index=True)
+        # corners of the largest (3 x 3 x 3 x 3) stencil, the third neighbour
+        # duplicates the second one for points that are not on a grid node
+        corner = np.ix_(*[np.arange(3)] * 4)
+        block_size = max(1, _BLOCK_BYTES // (8 * 81))
+        block_nodes = []
+        for block_start in range(0, distinct.shape[0], block_size):
+            block = distinct[block_start : block_start + block_size]
+            counter = self._get_counter(*[position[index[block]][:, corner[dim]] for dim, (position, index) in enumerate(zip(positions, point_index))])
+            block_nodes.append(np.unique(counter))
+        return np.unique(np.concatenate(block_nodes))
 
-        _array_argument, _dummy_array = self._array_argument, self._dummy_array
-        _input_shape, argument_collection = self._input_shape, self.argument_collection
-
-        if np.sum(_dummy_array) == 4 or np.sum(_array_argument) == 0:
-            _argument = [argument[0] for argument in argument_collection]
-            return self._find_all_batches_single(*_argument)
-
-        _all_batches_all_data: Set[int] = set()
-        for indx in range(np.prod(_input_shape)):
-            _argument = []
-            for arg_pos, _dummy in enumerate(_dummy_array):
-                if _dummy or not (_array_argument[arg_pos]):
-                    _argument.append(argument_collection[arg_pos][0])
-                else:
-                    _argument.append(argument_collection[arg_pos][indx])
-            nH_val, temp_val, met_val, red_val = _argument
-            _all_batches_all_data = _all_batches_all_data.union(self._find_all_batches_single(nH_val, temp_val, met_val, red_val))
-        if _all_batches_all_data == set():
-            raise ValueError("Problem identifying batches! Code Aborted!")
-        return _all_batches_all_data
-
-    def _transform_edges(self: "DataSift", i: int, j: int, k: int, m: int) -> Tuple[int, int, int, int]:
-        # Detect the edge cases
-        if i == self.nH_data.shape[0]:
-            if _warn:
-                print("Problem: nH")
-            i = i - 1
-        if i == -1:
-            if _warn:
-                print("Problem: nH")
-            i = i + 1
-        if j == self.T_data.shape[0]:
-            if _warn:
-                print("Problem: T")
-            j = j - 1
-        if j == -1:
-            if _warn:
-                print("Problem: T")
-            j = j + 1
-        if k == self.Z_data.shape[0]:
-            if _warn:
-                print("Problem: met")
-            k = k - 1
-        if k == -1:
-            if _warn:
-                print("Problem: met")
-            k = k + 1
-        if m == self.red_data.shape[0]:
-            if _warn:
-                print("Problem: red")
-            m = m - 1
-        if m == -1:
-            if _warn:
-                print("Problem: red")
-            m = m + 1
-        return (i, j, k, m)
-
-    def _identify_pos_in_each_dim(
-        self: "DataSift",
-        nH: Union[int, float],
-        temperature: Union[int, float],
-        metallicity: Union[int, float],
-        redshift: Union[int, float],
-    ) -> Tuple[List[int], List[int], List[int], List[int]]:
-        # positions in each data just around the requested value for any variable
-        i_vals, j_vals, k_vals, m_vals = None, None, None, None
-        if np.sum(nH == self.nH_data) == 1:
-            eq = int(np.where(nH == self.nH_data)[0][0])
-            i_vals = [eq - 1, eq, eq + 1]
-        else:
-            i_vals = [
-                np.sum(nH > self.nH_data) - 1,
-                np.sum(nH > self.nH_data),
-            ]
-
-        if np.sum(temperature == self.T_data) == 1:
-            eq = int(np.where(temperature == self.T_data)[0][0])
-            j_vals = [eq - 1, eq, eq + 1]
-        else:
-            j_vals = [
-                np.sum(temperature > self.T_data) - 1,
-                np.sum(temperature > self.T_data),
-            ]
-
-        if np.sum(metallicity == self.Z_data) == 1:
-            eq = int(np.where(metallicity == self.Z_data)[0][0])
-            k_vals = [eq - 1, eq, eq + 1]
-        else:
-            k_vals = [
-                np.sum(metallicity > self.Z_data) - 1,
-                np.sum(metallicity > self.Z_data),
-            ]
-
-        if np.sum(redshift == self.red_data) == 1:
-            eq = int(np.where(redshift == self.red_data)[0][0])
-            m_vals = [eq - 1, eq, eq + 1]
-        else:
-            m_vals = [
-                np.sum(redshift > self.red_data) - 1,
-                np.sum(redshift > self.red_data),
-            ]
-
-        return (i_vals, j_vals, k_vals, m_vals)
-
-    def _find_all_batches_single(
+    def _find_all_batches(
         self: "DataSift",
-        nH: Union[int, float],
-        temperature: Union[int, float],
-        metallicity: Union[int, float],
-        redshift: Union[int, float],
-    ) -> Set[int]:
+        stencils: List[Tuple[np.ndarray, np.ndarray]],
+        nodes: Optional[np.ndarray] = None,
+        point_index: Optional[List[np.ndarray]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Find the batches needed from the data files.
+        Find the batches needed from the data files for all the requested points.
 
         Parameters
         ----------
-        nH : float
-            Hydrogen number density (all hydrogen both neutral and ionized.
-        temperature : float
-            Plasma temperature.
-        metallicity : float
-            Plasma metallicity with respect to solar.
-        redshift : float
-            Cosmological redshift of the universe.
+        stencils : list of (np.ndarray, np.ndarray)
+            neighbouring grid indices along each axis
+            for every value (from `_stencil_positions`).
+        nodes : np.ndarray, optional
+            grid nodes of the stencils (from `_stencil_nodes`).
+            The default is None (computed here).
+        point_index : list of np.ndarray, optional
+            position of every point in the values along each axis.
+            The default is None (one value per point).
 
         Returns
         -------
-        batch_ids : set
-            Set of all the unique batch ids.
-
+        (batch_ids, point_batch) : (np.ndarray, np.ndarray)
+            sorted unique batch ids of all the stencil corners and for
+            every point the position in batch_ids of the batch holding its
+            lowest corner (used to process the points batch by batch).
         """
-        i_vals, j_vals, k_vals, m_vals = self._identify_pos_in_each_dim(nH, temperature, metallicity, redshift)
-
-        batch_ids = set()
-        # identify unique batches
-        for i, j, k, m in product(i_vals, j_vals, k_vals, m_vals):
-            i, j, k, m = self._transform_edges(i, j, k, m)
-            batch_id = self._identify_batch(i, j, k, m)
-            batch_ids.add(batch_id)
-
-        # print("Batches involved: ", batch_ids)
-
-        # self._fetch_data(batch_ids)
-
-        return batch_ids
+        if point_index is None:
+            point_index = [np.arange(stencils[0][0].shape[0])] * 4
+        if self._tiles is not None:
+            # the tile holding the whole stencil of every point
+            point_tile = self._anchor_tiles(
+                [stencil[0][index, 0] for stencil, index in zip(stencils, point_index)], [stencil[0][index, 2] for stencil, index in zip(stencils, point_index)]
+            )
+            batch_ids = np.unique(point_tile)
+            return (batch_ids, np.searchsorted(batch_ids, point_tile))
+        if nodes is None:
+            nodes = self._stencil_nodes(stencils, point_index)
+        # counters grow with every index, so nodes of a batch are contiguous
+        batch_ids = np.unique(nodes // self.batch_size)
+        if batch_ids.shape[0] == 0:
+            raise ValueError("Problem identifying batches! Code Aborted!")
+        lowest_batch = self._get_counter(*[stencil[0][index, 0] for stencil, index in zip(stencils, point_index)]) // self.batch_size
+        return (batch_ids, np.searchsorted(batch_ids, lowest_batch))
 
     """
     @abstractmethod
@@ -377,6 +471,30 @@ class DataSift(ABC):
     def _get_file_path(self: "DataSift", batch_id: int) -> Path:
         pass
 
+    def _store(self: "DataSift", interp_data: str) -> Optional[np.ndarray]:
+        """
+        Memory-mapped store of a dataset (from `pack_table`) with one row
+        per position in the table, None when the dataset is only in batch files.
+        """
+        if interp_data not in self._stores:
+            store = open_store(self._table_name, interp_data) if self._tiles is None else None
+            if store is not None:
+                if store.shape[:4] != tuple(axis.shape[0] for axis in self._axes[::-1]):
+                    raise ValueError(f"Problem! The store of {interp_data} in {self._table_name} does not match the table.")
+                store = store.reshape((self.total_size, -1))
+            self._stores[interp_data] = store
+        return self._stores[interp_data]
+
+    def _ensure_batches(
+        self: "DataSift",
+        interp_data: str,
+        batch_ids: Union[np.ndarray, List[int]],
+    ) -> None:
+        # Download files on demand if absent locally (not needed with a store,
+        # not possible for tiles: the server only holds the original batches)
+        if should_check_or_download_data() and self._store(interp_data) is None and self._tiles is None:
+            self._check_and_download(specific_file_ids=set(np.unique(batch_ids).tolist()))
+
     def _interpolate(
         self: "DataSift",
         nH: Union[int, float, list, np.ndarray],
@@ -391,6 +509,9 @@ class DataSift(ABC):
             None,
             None,
         ),
+        method: str = "idw",
+        columns: Optional[Union[slice, Sequence[int], np.ndarray]] = None,
+        out: Optional[np.ndarray] = None,
     ) -> Tuple[np.ndarray, bool]:
         """
         Interpolate from pre-computed Cloudy table.
@@ -422,6 +543,20 @@ class DataSift(ABC):
             The default is linear. log10 is another popular choice.
         cut : upper and lower bound on  data
             The default is (None, None)
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        columns : slice or list of int, optional
+            columns of the data to be read and interpolated.
+            The default is None (all columns).
+        out : np.ndarray, optional
+            buffer with the size of the result (from `_result_buffer`) the
+            interpolated values are written into when it is C-contiguous,
+            the result is then a view of it.
+            The default is None (new float64 array).
 
         Returns
         -------
@@ -429,98 +564,877 @@ class DataSift(ABC):
             The interpolated result.
         """
 
+        if not (mode == "PIE" or mode == "CIE"):
+            raise ValueError("Problem! Invalid mode: %s." % mode)
+        if not (method == "idw" or method == "linear"):
+            raise ValueError("Problem! Invalid method: %s." % method)
+
+        # a single point skips the array machinery altogether
+        values = [float(argument) for argument in (nH, temperature, metallicity, redshift) if isinstance(argument, (int, float, np.integer, np.floating))]
+        # non-positive values on the log axes are left to the array path
+        if len(values) == 4 and all(
+            math.isfinite(value) and (value > 0 or method == "idw" or scale == "linear") for value, scale in zip(values, self._axis_scale)
+        ):
+            self._array_argument, self._dummy_array = [False] * 4, [False] * 4
+            self._input_shape: Tuple[int, ...] = (1,)
+            self.argument_collection = [np.array([value]) for value in values]
+            interp_value = self._interpolate_scalar(values, interp_data, scaling_func, cut, method, columns)
+            buffer = _point_buffer(out, 1, interp_value.shape[0])
+            if buffer is None:
+                return (interp_value, False)
+            buffer[0] = interp_value
+            return (buffer[0], False)
+
         self._array_argument, self._dummy_array = self._process_arguments_flags(nH, temperature, metallicity, redshift)
         self._input_shape, self.argument_collection = self._prepare_arguments(nH, temperature, metallicity, redshift, self._array_argument, self._dummy_array)
 
         _array_argument, _dummy_array = self._array_argument, self._dummy_array
         _input_shape, argument_collection = self._input_shape, self.argument_collection
 
-        if not (mode == "PIE" or mode == "CIE"):
-            raise ValueError("Problem! Invalid mode: %s." % mode)
+        # every argument as a 1d array of its own values, the arguments are
+        # broadcasted through the position of every requested point in them
+        _broadcast_shape = np.broadcast_shapes(*[argument.shape for argument in argument_collection])
+        points = [argument.reshape(-1) for argument in argument_collection]
+        point_index = [np.broadcast_to(np.arange(argument.size).reshape(argument.shape), _broadcast_shape).reshape(-1) for argument in argument_collection]
+        column_runs = self._column_runs(interp_data, columns)
+        n_columns = sum(run.stop - run.start for run in column_runs)
+        # the kernels write straight into out (None: a new float64 array)
+        buffer = _point_buffer(out, point_index[0].shape[0], n_columns)
+
+        # arguments along separate axes: quadrilinear weights factorize per axis
+        grid_axes = self._separable_axes(argument_collection, _broadcast_shape) if method == "linear" else None
+        if grid_axes is not None:
+            interp_value = self._interpolate_grid_linear(points, grid_axes, interp_data, cut, columns, buffer)
+            if interp_value is not None:
+                return self._shape_output(interp_value)
+
+        # the same stencils decide the files to download and the rows read
+        stencils = [self._stencil_positions(dim, values) for dim, values in enumerate(points)]
+        nodes = self._stencil_nodes(stencils, point_index)
+        batch_ids, point_batch = self._find_all_batches(stencils, nodes, point_index)
+        self._ensure_batches(interp_data, batch_ids)
+        # points sharing batch files are processed together
+        order = np.argsort(point_batch, kind="stable")
+
+        # batch-major: every batch file is read once for the whole query
+        table_rows = None
+        if self.batch_major and nodes.shape[0] * n_columns * 8 <= _PREFETCH_BYTES:
+            table_rows = (nodes, self._gather(interp_data, *self._locate_nodes(nodes, batch_ids), column_runs))
+        if method == "linear":
+            interp_value = self._interpolate_points_linear(points, interp_data, cut, column_runs, order, table_rows, point_index, buffer)
+        else:
+            interp_value = self._interpolate_points(points, interp_data, scaling_func, cut, column_runs, stencils, order, table_rows, point_index, buffer)
+        return self._shape_output(interp_value)
 
-        batch_ids = self._find_all_batches(nH, temperature, metallicity, redshift)
-        # Download files on demand if absent locally
-        if should_check_or_download_data():
-            self._check_and_download(specific_file_ids=batch_ids)
+    def _interpolate_scalar(
+        self: "DataSift",
+        values: List[float],
+        interp_data: str,
+        scaling_func: Callable = lambda x: x,
+        cut: Tuple[Optional[Union[float, int]], Optional[Union[float, int]]] = (
+            None,
+            None,
+        ),
+        method: str = "idw",
+        columns: Optional[Union[slice, Sequence[int], np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        Interpolate at a single point (like the ODE right hand sides calling
+        once per step). Same results as the array path, but the stencil and
+        weights are computed with plain floats on the axes as lists and the
+        table rows of the stencil are kept in the batch cache (when enabled)
+        for the next calls.
+
+        Parameters
+        ----------
+        values : list of float
+            nH, temperature, metallicity and redshift (all finite and
+            positive along the log axes for linear interpolation).
+        interp_data : str
+            data location within HDF5 file
+        scaling_func : callable function, optional
+            function space in which intrepolation is carried out.
+            The default is linear.
+        cut : upper and lower bound on  data
+            The default is (None, None)
+        method : str, optional
+            interpolation scheme, either idw or linear.
+            The default is 'idw'.
+        columns : slice or list of int, optional
+            columns of the data to be read and interpolated.
+            The default is None (all columns).
 
-        # Load the data to memory from disk
-        data = []
-        for batch_id in batch_ids:
-            filename = self._get_file_path(batch_id)
-            hdf = h5py.File(filename, "r")
-            data.append({"batch_id": batch_id, "file": hdf})
+        Returns
+        -------
+        interp_value : np.ndarray
+            Interpolated values of the columns (1d).
         """
-        if np.sum(_dummy_array) == 4 or np.sum(_array_argument) == 0:
-            _argument = [argument[0] for argument in argument_collection]
-            i_vals, j_vals, k_vals, m_vals = self._identify_pos_in_each_dim(*_argument)
-        """
-        interp_value = []
-        for indx in range(np.prod(_input_shape)):
-            _argument = []
-            for arg_pos, _dummy in enumerate(_dummy_array):
-                if _dummy or not (_array_argument[arg_pos]):
-                    _argument.append(argument_collection[arg_pos][0])
-                else:
-                    _argument.append(argument_collection[arg_pos][indx])
-            nH_this, temperature_this, metallicity_this, redshift_this = _argument
-            i_vals, j_vals, k_vals, m_vals = self._identify_pos_in_each_dim(nH_this, temperature_this, metallicity_this, redshift_this)
-
-            """
-            The trick is to take the floor value for interpolation only if it is the
-            most frequent value in all the nearest neighbor. If not, then simply ignore
-            the contribution of the floor value in interpolation.
-            """
-            epsilon = 1e-15
-            _all_values = []
-            _all_weights = []
-            for i, j, k, m in product(i_vals, j_vals, k_vals, m_vals):
-                i, j, k, m = self._transform_edges(i, j, k, m)
-                # nearest neighbour interpolation
-                d_i = np.abs(scaling_func(self.nH_data[i]) - scaling_func(float(_argument[0])))
-                d_j = np.abs(scaling_func(self.T_data[j]) - scaling_func(float(_argument[1])))
-                d_k = np.abs(scaling_func(self.Z_data[k]) - scaling_func(float(_argument[2])))
-                d_m = np.abs(scaling_func(self.red_data[m]) - scaling_func(float(_argument[3])))
-                distL2 = np.sqrt(d_i**2 + d_j**2 + d_k**2 + d_m**2)
-                if distL2 <= 0.0:
-                    distL2 = epsilon
-                _all_weights.append(1 / distL2)
-
-                batch_id = self._identify_batch(i, j, k, m)
-
-                for id_data in data:
-                    if id_data["batch_id"] == batch_id:
-                        hdf = id_data["file"]
-                        local_pos = self._get_counter(i, j, k, m) % self.batch_size - 1
-                try:
-                    value = hdf[interp_data][local_pos, :]
-                except UnboundLocalError:
-                    print("Error: HDF5 files not properly loaded/initialized! Code Aborted!")
-                    sys.exit(1)
-
-                if cut[0] is not None:
-                    value = np.piecewise(value, [value <= cut[0]], [cut[0], lambda x: x])
-                if cut[1] is not None:
-                    value = np.piecewise(value, [value >= cut[1]], [cut[1], lambda x: x])
-                _all_values.append(value)
-
-            all_values = np.array(_all_values)
-            all_weights = np.array(_all_weights)
-            # Filter the outliers (deviation from mean across column is large)
-            all_values[(np.abs(all_values - np.mean(all_values, axis=0)) > 2.0 * np.std(all_values, axis=0))] = 0.0
-
-            # _median_value = np.median(_all_values, axis=0)
-            interp_value.append(all_weights.T @ all_values / np.sum(all_weights))
-            # if (len(interp_value.shape)==2):
-            #     interp_value = interp_value[0]
-
-        for id_data in data:
-            id_data["file"].close()
-        if np.sum(_dummy_array) == 4 or np.sum(_array_argument) == 0:
+        neighbours = [_scalar_stencil(axis, value) for axis, value in zip(self._axis_lists, values)]
+        linear = method == "linear"
+        factors = []
+        for dim, (axis, value, positions) in enumerate(zip(self._axis_lists, values, neighbours)):
+            if linear:
+                factors.append(_scalar_linear_factors(axis, value, positions, self._axis_scale[dim] == "log"))
+            else:
+                scaled = scaling_func(value)
+                factors.append([(position, abs(scaling_func(axis[position]) - scaled) ** 2) for position in positions])
+
+        # corners in the same order as the array path (product of i, j, k, m),
+        # partial sums and products over the outer axes are shared
+        # (linear weights, or squared distances for idw)
+        n_nH, n_T, n_Z = len(self._axis_lists[0]), len(self._axis_lists[1]), len(self._axis_lists[2])
+        counters = []
+        weights = []
+        for i, f_i in factors[0]:
+            w_i = 1.0 * f_i if linear else 0.0 + f_i
+            for j, f_j in factors[1]:
+                c_j, w_j = j * n_nH + i, w_i * f_j if linear else w_i + f_j
+                for k, f_k in factors[2]:
+                    c_k, w_k = k * n_T * n_nH + c_j, w_j * f_k if linear else w_j + f_k
+                    for m, f_m in factors[3]:
+                        counters.append(m * n_Z * n_T * n_nH + c_k)
+                        weights.append(w_k * f_m if linear else w_k + f_m)
+
+        # only the requested columns of the stencil rows are read and kept
+        column_runs = self._column_runs(interp_data, columns)
+        # the rows of recent stencils are kept in the batch cache (within its budget)
+        use_cache = self.batch_cache.max_bytes > 0
+        key = (self._table_name, interp_data, tuple((run.start, run.stop) for run in column_runs), *counters)
+        rows = self.batch_cache.get(key) if use_cache else None
+        if rows is None:
+            anchor_tile = self._anchor_tiles([[positions[0]] for positions in neighbours], [[positions[-1]] for positions in neighbours])
+            batch_id, local_pos = self._locate_nodes(np.array(counters), anchor_tile)
+            self._ensure_batches(interp_data, batch_id)
+            rows = self._gather(interp_data, batch_id, local_pos, column_runs)
+            if use_cache:
+                self.batch_cache.put(key, rows)
+
+        if rows.shape[1] == 1:
+            # a single column (like one ion) is cheaper with plain floats than numpy
+            values = rows[:, 0].tolist()
+            if cut[0] is not None:
+                values = [cut[0] if value <= cut[0] else value for value in values]
+            if cut[1] is not None:
+                values = [cut[1] if value >= cut[1] else value for value in values]
+            if linear:
+                return np.array([sum([weight * value for weight, value in zip(weights, values)])])
+            return np.array([_idw_average_floats(values, weights)])
+
+        # the cached rows are left untouched by the cut
+        all_values = rows[np.newaxis].copy()
+        self._apply_cut(all_values, cut)
+        if linear:
+            return _linear_average(all_values, np.array([weights]))[0]
+        return _idw_average(all_values, np.array([weights]))[0]
+
+    def _shape_output(
+        self: "DataSift",
+        interp_value: np.ndarray,
+    ) -> Tuple[np.ndarray, bool]:
+        # interpolated values of shape (points, columns) to the requested shape
+        if np.sum(self._dummy_array) == 4 or np.sum(self._array_argument) == 0:
             return (interp_value[0], False)
         else:
-            _tmp = np.array(interp_value).reshape((*_input_shape, *np.array(interp_value[0]).shape))
+            _tmp = interp_value.reshape((*self._input_shape, *interp_value.shape[1:]))
             return (_tmp, True)
 
+    def _output_buffer(
+        self: "DataSift",
+        shape: Tuple[int, ...],
+        out: Optional[np.ndarray] = None,
+        dtype: Optional[Union[str, type, np.dtype]] = None,
+    ) -> np.ndarray:
+        """
+        Buffer for the results of a query: the one provided by the caller
+        (checked against the shape and dtype of the results) or a new one.
+        """
+        if out is None:
+            return np.empty(shape, dtype=np.float64 if dtype is None else dtype)
+        if dtype is not None and np.dtype(dtype) != out.dtype:
+            raise ValueError(f"Problem! Requested dtype {np.dtype(dtype)} differs from the dtype {out.dtype} of out.")
+        if tuple(out.shape) != tuple(shape):
+            raise ValueError(f"Problem! out of shape {tuple(out.shape)} for results of shape {tuple(shape)}.")
+        return out
+
+    def _result_buffer(
+        self: "DataSift",
+        nH: Union[int, float, list, np.ndarray],
+        temperature: Union[int, float, list, np.ndarray],
+        metallicity: Union[int, float, list, np.ndarray],
+        redshift: Union[int, float, list, np.ndarray],
+        mode: str,
+        n_columns: Optional[int],
+        out: Optional[np.ndarray] = None,
+        dtype: Optional[Union[str, type, np.dtype]] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Buffer for the results of a query, checked before interpolating so that
+        the interpolation can write into it (see `_interpolate`): the arguments
+        broadcasted with n_columns values each (no column axis when None).
+        None when neither out nor dtype is requested (float64 results).
+        """
+        if out is None and dtype is None:
+            return None
+        shape: Tuple[int, ...] = ()
+        if self._determine_multiple(nH, temperature, metallicity, redshift, mode):
+            shape = np.broadcast_shapes(*[np.shape(argument) for argument in (nH, temperature, metallicity, redshift)])
+        return self._output_buffer(shape if n_columns is None else (*shape, n_columns), out, dtype)
+
+    def _write_output(
+        self: "DataSift",
+        result: Union[float, np.ndarray],
+        out: Optional[np.ndarray] = None,
+        dtype: Optional[Union[str, type, np.dtype]] = None,
+        buffer: Optional[np.ndarray] = None,
+    ) -> Union[float, np.ndarray]:
+        # results written in out (returned back) or cast to dtype,
+        # in the buffer from `_result_buffer` when given
+        if out is None and dtype is None:
+            return result
+        if buffer is None:
+            buffer = self._output_buffer(np.shape(result), out, dtype)
+        # nothing left to copy when the interpolation wrote into the buffer
+        if not (isinstance(result, np.ndarray) and np.may_share_memory(result, buffer)):
+            buffer[...] = result
+        return buffer if out is not None else buffer[()]
+
+    def _grid_arguments(
+        self: "DataSift",
+        nH: Union[int, float, list, np.ndarray],
+        temperature: Union[int, float, list, np.ndarray],
+        metallicity: Union[int, float, list, np.ndarray],
+        redshift: Union[int, float, list, np.ndarray],
+    ) -> List:
+        """
+        Place the array arguments along separate axes so that they
+        broadcast to the grid of all their combinations
+        (as np.meshgrid with ij indexing). Single values are left as they are.
+
+        Parameters
+        ----------
+        nH : float, list, np.ndarray
+            Hydrogen number density (all hydrogen both neutral and ionized.
+        temperature : float, list, np.ndarray
+            Plasma temperature.
+        metallicity : float, list, np.ndarray
+            Plasma metallicity with respect to solar.
+        redshift : float, list, np.ndarray
+            Cosmological redshift of the universe.
+
+        Returns
+        -------
+        arguments : list
+            nH, temperature, metallicity and redshift
+            with one axis per array argument in this order.
+        """
+        arguments: List = []
+        array_arguments = [isinstance(argument, (list, np.ndarray)) and np.ndim(argument) > 0 for argument in (nH, temperature, metallicity, redshift)]
+        n_axes = sum(array_arguments)
+        axis = 0
+        for argument, is_array in zip((nH, temperature, metallicity, redshift), array_arguments):
+            if not (is_array):
+                arguments.append(argument)
+                continue
+            if np.ndim(argument) != 1:
+                raise ValueError("Problem! Grid query needs 1d arrays as arguments.")
+            shape = [1] * n_axes
+            shape[axis] = -1
+            arguments.append(np.asarray(argument).reshape(shape))
+            axis += 1
+        return arguments
+
+    def _separable_axes(
+        self: "DataSift",
+        argument_collection: List[np.ndarray],
+        broadcast_shape: Tuple[int, ...],
+    ) -> Optional[List[int]]:
+        """
+        Axis of the broadcasted result along which every argument varies.
+        None if two arguments vary along the same axis or an argument
+        varies along more than one axis. Single values get an axis of their own
+        after the axes of the result.
+        """
+        grid_axes = []
+        extra_axis = len(broadcast_shape)
+        for argument in argument_collection:
+            varying = [indx for indx, length in enumerate(argument.shape) if length > 1]
+            if len(varying) > 1:
+                return None
+            if len(varying) == 0:
+                grid_axes.append(extra_axis)
+                extra_axis += 1
+            else:
+                grid_axes.append(len(broadcast_shape) - argument.ndim + varying[0])
+        if len(set(grid_axes)) < len(grid_axes):
+            return None
+        return grid_axes
+
+    def _interpolate_grid_linear(
+        self: "DataSift",
+        points: List[np.ndarray],
+        grid_axes: List[int],
+        interp_data: str,
+        cut: Tuple[Optional[Union[float, int]], Optional[Union[float, int]]] = (
+            None,
+            None,
+        ),
+        columns: Optional[Union[slice, Sequence[int], np.ndarray]] = None,
+        out: Optional[np.ndarray] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Quadrilinear interpolation on the grid of all the combinations of the values
+        along each axis. The weights factorize per axis, so the table block
+        spanned by the values is read once and contracted one axis at a time.
+
+        Parameters
+        ----------
+        points : list of np.ndarray
+            values of nH, temperature, metallicity and redshift (all 1d).
+        grid_axes : list of int
+            axis of the result along which each of the arguments varies.
+        interp_data : str
+            data location within HDF5 file
+        cut : upper and lower bound on  data
+            The default is (None, None)
+        columns : slice or list of int, optional
+            columns of the data to be read and interpolated.
+            The default is None (all columns).
+        out : np.ndarray, optional
+            array of shape (points, columns) to write the values into.
+            The default is None (new float64 array).
+
+        Returns
+        -------
+        interp_value : np.ndarray or None
+            Interpolated values of shape (points, columns).
+            None if the table block is too large to be read at once.
+        """
+        # nodes of every axis used by the values and the weight of each node
+        nodes = []
+        axis_weights = []
+        for dim, values in enumerate(points):
+            lower, upper, weight = self._linear_weights(dim, values)
+            axis_nodes, inverse = np.unique(np.concatenate((lower, upper)), return_inverse=True)
+            weights = np.zeros((values.shape[0], axis_nodes.shape[0]), dtype=np.float64)
+            np.add.at(weights, (np.arange(values.shape[0]), inverse[: values.shape[0]]), 1.0 - weight)
+            np.add.at(weights, (np.arange(values.shape[0]), inverse[values.shape[0] :]), weight)
+            nodes.append(axis_nodes)
+            axis_weights.append(weights)
+
+        counter = np.asarray(self._get_counter(*np.ix_(*nodes))).reshape(-1)
+        batch_id, local_pos = self._locate_nodes(counter)
+        self._ensure_batches(interp_data, batch_id)
+        column_runs = self._column_runs(interp_data, columns)
+        n_columns = sum(run.stop - run.start for run in column_runs)
+        if counter.shape[0] * n_columns * 8 > _PREFETCH_BYTES:
+            return None
+
+        table_block = self._gather(interp_data, batch_id, local_pos, column_runs).reshape((*[axis_nodes.shape[0] for axis_nodes in nodes], n_columns))
+        self._apply_cut(table_block, cut)
+        # axes of the result in the broadcasted order (single values have length 1)
+        result_axes = np.argsort(grid_axes)
+        subscripts = "ai,bj,ck,dl,ijklx->" + "".join(["abcd"[dim] for dim in result_axes]) + "x"
+        if out is None:
+            return np.einsum(subscripts, *axis_weights, table_block, optimize=True).reshape(-1, n_columns)
+        result_shape = (*[points[dim].shape[0] for dim in result_axes], n_columns)
+        np.einsum(subscripts, *axis_weights, table_block, out=out.reshape(result_shape), casting="same_kind", optimize=True)
+        return out
+
+    def _bracket(
+        self: "DataSift",
+        dim: int,
+        values: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Locate the requested values on one of the table axes.
+
+        Parameters
+        ----------
+        dim : int
+            0: nH, 1: temperature, 2: metallicity, 3: redshift
+        values : np.ndarray 1d
+            Requested values along that axis.
+
+        Returns
+        -------
+        (above, exact) : (np.ndarray, np.ndarray)
+            above is the number of grid values strictly smaller than the requested
+            value, exact flags the values that sit on a grid node.
+        """
+        axis_data = self._axes[dim]
+        spacing = self._axis_spacing[dim]
+        n_nodes = axis_data.shape[0]
+        if spacing is None:
+            above = np.searchsorted(axis_data, values, side="left")
+            above[np.isnan(values)] = 0  # no grid value is smaller than nan
+        else:
+            # grid is uniform in linear or log space: the position follows directly
+            scale, start, step = spacing
+            with np.errstate(divide="ignore", invalid="ignore"):
+                guess = np.ceil(((np.log10(values) if scale == "log" else values) - start) / step)
+            above = np.clip(np.nan_to_num(guess, nan=0.0), 0, n_nodes).astype(np.int64)
+            # the guess can only be off by one node due to round-off
+            above -= (above > 0) & (axis_data[np.maximum(above - 1, 0)] >= values)
+            above += (above < n_nodes) & (axis_data[np.minimum(above, n_nodes - 1)] < values)
+        exact = (above < n_nodes) & (axis_data[np.minimum(above, n_nodes - 1)] == values)
+        return (above, exact)
+
+    def _stencil_positions(
+        self: "DataSift",
+        dim: int,
+        values: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Neighbouring grid nodes of the requested values along a single axis.
+        Nodes falling outside the table are moved back to the edge node.
+
+        Parameters
+        ----------
+        dim : int
+            0: nH, 1: temperature, 2: metallicity, 3: redshift
+        values : np.ndarray 1d
+            Requested values along that axis.
+
+        Returns
+        -------
+        (positions, exact) : (np.ndarray, np.ndarray)
+            positions has shape (N, 3) and holds the neighbouring grid indices
+            clamped to the grid. The third column is only part of the stencil
+            where exact is True (value sits on a grid node), otherwise it
+            duplicates the second column.
+        """
+        n_nodes = self._axes[dim].shape[0]
+        above, exact = self._bracket(dim, values)
+        positions = np.stack((above - 1, above, np.where(exact, above + 1, above)), axis=-1)
+        if _warn and (np.any(positions < 0) or np.any(positions >= n_nodes)):
+            print("Problem: requested value at the edge of the table")
+        return (np.clip(positions, 0, n_nodes - 1), exact)
+
+    def _locate_rows(
+        self: "DataSift",
+        i: np.ndarray,
+        j: np.ndarray,
+        k: np.ndarray,
+        m: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Batch id and row within the batch file for every grid node requested.
+        Rows are addressed exactly as the scalar reader always did
+        (`counter % batch_size - 1`), where -1 refers to the last row of the batch.
+        """
+        return self._locate_nodes(self._get_counter(i, j, k, m))
+
+    def _anchor_tiles(
+        self: "DataSift",
+        lowest: Sequence[Union[Sequence[int], np.ndarray]],
+        highest: Sequence[Union[Sequence[int], np.ndarray]],
+    ) -> Optional[np.ndarray]:
+        """
+        Tile holding the whole stencil of every point from its lowest and highest
+        node along each axis (None for tables in batches). Stencils span at most
+        3 nodes, all within one node of their anchor, so the tile with the anchor
+        in its core holds the stencil.
+        """
+        if self._tiles is None:
+            return None
+        core, _, count = self._tiles
+        anchor = [np.minimum(np.asarray(low) + 1, np.asarray(high)) for low, high in zip(lowest, highest)]
+        return self._tile_rows([np.minimum(index // core[dim], count[dim] - 1) for dim, index in enumerate(anchor)], anchor)[0]
+
+    def _tile_rows(
+        self: "DataSift",
+        tile: List[np.ndarray],
+        index: Sequence[np.ndarray],
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # batch id of the tiles (tile indices along each axis) and row of the nodes within them
+        _, extent, count = self._tiles
+        batch_id = np.zeros(np.shape(index[0]), dtype=np.int64)
+        local_pos = np.zeros(np.shape(index[0]), dtype=np.int64)
+        for dim in (3, 2, 1, 0):
+            batch_id = batch_id * count[dim] + tile[dim]
+            local_pos = local_pos * extent[dim] + index[dim] - tile_origin(self._tiles, self._grid, dim, tile[dim])
+        return (batch_id, local_pos)
+
+    def _locate_nodes(
+        self: "DataSift",
+        counter: Union[int, np.ndarray],
+        batch_ids: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Batch id and row within the batch file from the flat position in the table.
+        In a tiled table a node is in its own tile and in the neighbouring ones
+        through their halo, it is read from one of batch_ids (the tiles of the
+        query) when possible, otherwise from its own tile.
+        """
+        if self._tiles is not None:
+            core, extent, count = self._tiles
+            index = np.unravel_index(counter, self._grid[::-1])[::-1]
+            tile = [np.minimum(index[dim] // core[dim], count[dim] - 1) for dim in range(4)]
+            if batch_ids is None:
+                return self._tile_rows(tile, index)
+            own_tile = [np.copy(tile_index) for tile_index in tile]
+            found = np.zeros(np.shape(counter), dtype=bool)
+            for shift in product((0, -1, 1), repeat=4):
+                candidate = [own_tile[dim] + shift[dim] for dim in range(4)]
+                holds = ~found
+                for dim in range(4):
+                    origin = tile_origin(self._tiles, self._grid, dim, candidate[dim])
+                    holds &= (candidate[dim] >= 0) & (candidate[dim] < count[dim]) & (origin <= index[dim]) & (index[dim] < origin + extent[dim])
+                if not np.any(holds):
+                    continue
+                holds &= np.isin(self._tile_rows(candidate, index)[0], batch_ids)
+                for dim in range(4):
+                    tile[dim] = np.where(holds, candidate[dim], tile[dim])
+                found |= holds
+                if np.all(found):
+                    break
+            return self._tile_rows(tile, index)
+        batch_id = counter // self.batch_size
+        local_pos = counter % self.batch_size - 1
+        rows_in_batch = np.minimum(self.batch_size, self.total_size - batch_id * self.batch_size)
+        local_pos = np.where(local_pos < 0, rows_in_batch - 1, local_pos)
+        return (batch_id, local_pos)
+
+    def _gather(
+        self: "DataSift",
+        interp_data: str,
+        batch_id: np.ndarray,
+        local_pos: np.ndarray,
+        column_runs: Optional[List[slice]] = None,
+    ) -> np.ndarray:
+        """
+        Read the table rows for all the requested (batch_id, local_pos) pairs.
+        With a store, the rows are indexed directly in its memory map.
+        Otherwise every batch is served from the batch cache when enabled,
+        or read with a single sorted fancy-index read per run of columns.
+        """
+        if column_runs is None:
+            column_runs = self._column_runs(interp_data)
+        store = self._store(interp_data)
+        if store is not None:
+            # back to the position in the table (inverse of `_locate_nodes`)
+            rows_in_batch = np.minimum(self.batch_size, self.total_size - batch_id * self.batch_size)
+            rows, inverse = np.unique(batch_id * self.batch_size + (local_pos + 1) % rows_in_batch, return_inverse=True)
+            if len(column_runs) == 1:
+                block = store[rows, column_runs[0]]
+            else:
+                block = np.concatenate([store[rows, run] for run in column_runs], axis=1)
+            return block[inverse.reshape(batch_id.shape)].astype(np.float64, copy=False)
+        values: Optional[np.ndarray] = None
+        use_cache = self.batch_cache.max_bytes > 0
+        for this_batch in np.unique(batch_id):
+            in_batch = batch_id == this_batch
+            rows, inverse = np.unique(local_pos[in_batch], return_inverse=True)
+            # the dataset name carries the mode (CIE/PIE)
+            cache_key = (self._table_name, interp_data, int(this_batch))
+            cached = self.batch_cache.get(cache_key) if use_cache else None
+            if cached is None:
+                dataset = self._file_pool.get(this_batch)[interp_data]
+                if use_cache and self.batch_cache.fits(dataset.size * dataset.dtype.itemsize):
+                    cached = dataset[()]
+                    self.batch_cache.put(cache_key, cached)
+            source = cached if cached is not None else dataset
+            if len(column_runs) == 1:
+                block = source[rows, column_runs[0]]
+            else:
+                block = np.concatenate([source[rows, run] for run in column_runs], axis=1)
+            if values is None:
+                values = np.empty((*batch_id.shape, *block.shape[1:]), dtype=np.float64)
+            values[in_batch] = block[inverse.reshape(-1)]
+        return values
+
+    def _corner_values(
+        self: "DataSift",
+        interp_data: str,
+        corner: List[np.ndarray],
+        column_runs: List[slice],
+        table_rows: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        Table values at the stencil corners (grid indices along each axis).
+        Looked up in the rows read ahead for the query (sorted node counters
+        and their values) when available, otherwise read from the batch files.
+        """
+        if table_rows is None:
+            if self._tiles is None:
+                return self._gather(interp_data, *self._locate_rows(*corner), column_runs)
+            anchor_tiles = self._anchor_tiles([index.min(axis=1) for index in corner], [index.max(axis=1) for index in corner])
+            return self._gather(interp_data, *self._locate_nodes(self._get_counter(*corner), anchor_tiles), column_runs)
+        nodes, values = table_rows
+        return values[np.searchsorted(nodes, self._get_counter(*corner))]
+
+    def _n_columns(self: "DataSift", interp_data: str) -> int:
+        # number of values stored per grid node (same in every batch)
+        if interp_data not in self._columns_per_node:
+            store = self._store(interp_data)
+            self._columns_per_node[interp_data] = store.shape[1] if store is not None else int(np.prod(self._file_pool.get(0)[interp_data].shape[1:]))
+        return self._columns_per_node[interp_data]
+
+    def _apply_cut(
+        self: "DataSift",
+        values: np.ndarray,
+        cut: Tuple[Optional[Union[float, int]], Optional[Union[float, int]]],
+    ) -> None:
+        # clip the table values in place to the lower and upper bound
+        if cut[0] is not None:
+            values[values <= cut[0]] = cut[0]
+        if cut[1] is not None:
+            values[values >= cut[1]] = cut[1]
+
+    def _column_runs(
+        self: "DataSift",
+        interp_data: str,
+        columns: Optional[Union[slice, Sequence[int], np.ndarray]] = None,
+    ) -> List[slice]:
+        """
+        Split the requested columns in runs of consecutive columns,
+        each of them is read from the HDF5 files as one hyperslab.
+
+        Parameters
+        ----------
+        interp_data : str
+            data location within HDF5 file
+        columns : slice or list of int, optional
+            columns requested. The default is None (all columns).
+
+        Returns
+        -------
+        column_runs : list of slice
+            runs of consecutive columns in the requested order.
+        """
+        n_columns = self._n_columns(interp_data)
+        if columns is None:
+            return [slice(0, n_columns)]
+        if isinstance(columns, slice):
+            start, stop, step = columns.indices(n_columns)
+            if step == 1 and stop > start:
+                return [slice(start, stop)]
+            columns = np.arange(start, stop, step)
+        columns = np.asarray(columns, dtype=np.int64).reshape(-1)
+        if columns.shape[0] == 0:
+            raise ValueError("Problem! No columns requested.")
+        if np.any(columns < 0) or np.any(columns >= n_columns):
+            raise ValueError(f"Problem! Invalid columns requested for {interp_data} with {n_columns} columns.")
+        breaks = np.flatnonzero(np.diff(columns) != 1) + 1
+        return [slice(int(run[0]), int(run[-1]) + 1) for run in np.split(columns, breaks)]
+
+    def _interpolate_points(
+        self: "DataSift",
+        points: List[np.ndarray],
+        interp_data: str,
+        scaling_func: Callable = lambda x: x,
+        cut: Tuple[Optional[Union[float, int]], Optional[Union[float, int]]] = (
+            None,
+            None,
+        ),
+        column_runs: Optional[List[slice]] = None,
+        stencils: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None,
+        order: Optional[np.ndarray] = None,
+        table_rows: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+        point_index: Optional[List[np.ndarray]] = None,
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Interpolate all the requested points at once.
+
+        Points are grouped by the shape of their stencil (2 neighbours along an axis,
+        or 3 when the point sits exactly on a grid node). Each group is then processed
+        as dense arrays of shape (points, corners, columns), in blocks that keep the
+        memory footprint bounded.
+
+        Parameters
+        ----------
+        points : list of np.ndarray
+            values of nH, temperature, metallicity and redshift (all 1d).
+        interp_data : str
+            data location within HDF5 file
+        scaling_func : callable function, optional
+            function space in which intrepolation is carried out.
+        cut : upper and lower bound on  data
+            The default is (None, None)
+        column_runs : list of slice, optional
+            runs of consecutive columns to interpolate.
+            The default is None (all columns).
+        stencils : list of (np.ndarray, np.ndarray), optional
+            neighbouring grid indices of the values along each axis (from `_stencil_positions`).
+            The default is None (computed here).
+        order : np.ndarray, optional
+            order in which the points are processed.
+            The default is None (as requested).
+        table_rows : (np.ndarray, np.ndarray), optional
+            table rows read ahead (sorted node counters and their values).
+            The default is None (read block by block).
+        point_index : list of np.ndarray, optional
+            position of every point in the values along each axis.
+            The default is None (one value per point).
+        out : np.ndarray, optional
+            array of shape (points, columns) to write the values into
+            (cast to its dtype block by block).
+            The default is None (new float64 array).
+
+        Returns
+        -------
+        interp_value : np.ndarray
+            Interpolated values of shape (points, columns).
+        """
+        axes = self._axes
+        if stencils is None:
+            stencils = [self._stencil_positions(dim, values) for dim, values in enumerate(points)]
+        if point_index is None:
+            point_index = [np.arange(points[0].shape[0])] * 4
+        n_points = point_index[0].shape[0]
+        if order is None:
+            order = np.arange(n_points)
+        # distance of every neighbouring node from the requested point in each dimension
+        distances = [
+            np.abs(scaling_func(axis[positions]) - scaling_func(values)[:, np.newaxis]) for axis, values, (positions, _) in zip(axes, points, stencils)
+        ]
+        if column_runs is None:
+            column_runs = self._column_runs(interp_data)
+        n_columns = sum(run.stop - run.start for run in column_runs)
+        interp_value = np.empty((n_points, n_columns), dtype=np.float64) if out is None else out
+
+        """
+        The trick is to take the floor value for interpolation only if it is the
+        most frequent value in all the nearest neighbor. If not, then simply ignore
+        the contribution of the floor value in interpolation.
+        """
+        stencil_kind = np.sum([exact[index].astype(np.int64) << dim for dim, ((_, exact), index) in enumerate(zip(stencils, point_index))], axis=0)
+        for kind in np.unique(stencil_kind):
+            members = order[stencil_kind[order] == kind]
+            # neighbours along each axis for this kind of stencil
+            width = [3 if (kind >> dim) & 1 else 2 for dim in range(4)]
+            n_corners = int(np.prod(width))
+            block_size = max(1, _BLOCK_BYTES // (8 * n_corners * n_columns))
+            for block_start in range(0, members.shape[0], block_size):
+                block = members[block_start : block_start + block_size]
+                # corners in the same order as product(i_vals, j_vals, k_vals, m_vals)
+                corner = []
+                corner_dist_sq = np.zeros((block.shape[0], 1, 1, 1, 1), dtype=np.float64)
+                for dim in range(4):
+                    rows = point_index[dim][block]
+                    shape = [block.shape[0], 1, 1, 1, 1]
+                    shape[dim + 1] = width[dim]
+                    corner.append(np.broadcast_to(stencils[dim][0][rows, : width[dim]].reshape(shape), (block.shape[0], *width)).reshape(block.shape[0], -1))
+                    corner_dist_sq = corner_dist_sq + distances[dim][rows, : width[dim]].reshape(shape) ** 2
+
+                all_values = self._corner_values(interp_data, corner, column_runs, table_rows).reshape(block.shape[0], n_corners, n_columns)
+                self._apply_cut(all_values, cut)
+                interp_value[block] = _idw_average(all_values, corner_dist_sq.reshape(block.shape[0], n_corners))
+        return interp_value
+
+    def _linear_weights(
+        self: "DataSift",
+        dim: int,
+        values: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Lower and upper grid node along one axis with the linear weight of the
+        upper node. Values outside the table are clamped to the edge node.
+
+        Parameters
+        ----------
+        dim : int
+            0: nH, 1: temperature, 2: metallicity, 3: redshift
+        values : np.ndarray 1d
+            Requested values along that axis.
+
+        Returns
+        -------
+        (lower, upper, weight) : (np.ndarray, np.ndarray, np.ndarray)
+            grid indices around the values and weight of the upper index.
+        """
+        axis_data = self._axes[dim]
+        n_nodes = axis_data.shape[0]
+        above, _ = self._bracket(dim, values)
+        lower = np.clip(above - 1, 0, n_nodes - 1)
+        upper = np.clip(above, 0, n_nodes - 1)
+        scale = np.log10 if self._axis_scale[dim] == "log" else (lambda x: x)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            node_lower = scale(axis_data[lower])
+            span = scale(axis_data[upper]) - node_lower
+            weight = np.where(span > 0, (scale(values) - node_lower) / np.where(span > 0, span, 1.0), 0.0)
+        return (lower, upper, np.clip(weight, 0.0, 1.0))
+
+    def _interpolate_points_linear(
+        self: "DataSift",
+        points: List[np.ndarray],
+        interp_data: str,
+        cut: Tuple[Optional[Union[float, int]], Optional[Union[float, int]]] = (
+            None,
+            None,
+        ),
+        column_runs: Optional[List[slice]] = None,
+        order: Optional[np.ndarray] = None,
+        table_rows: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+        point_index: Optional[List[np.ndarray]] = None,
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Quadrilinear interpolation of all the requested points at once
+        using the 16 corners of the hypercube around every point.
+
+        Parameters
+        ----------
+        points : list of np.ndarray
+            values of nH, temperature, metallicity and redshift (all 1d).
+        interp_data : str
+            data location within HDF5 file
+        cut : upper and lower bound on  data
+            The default is (None, None)
+        column_runs : list of slice, optional
+            runs of consecutive columns to interpolate.
+            The default is None (all columns).
+        order : np.ndarray, optional
+            order in which the points are processed.
+            The default is None (as requested).
+        table_rows : (np.ndarray, np.ndarray), optional
+            table rows read ahead (sorted node counters and their values).
+            The default is None (read block by block).
+        point_index : list of np.ndarray, optional
+            position of every point in the values along each axis.
+            The default is None (one value per point).
+        out : np.ndarray, optional
+            array of shape (points, columns) to write the values into
+            (cast to its dtype block by block).
+            The default is None (new float64 array).
+
+        Returns
+        -------
+        interp_value : np.ndarray
+            Interpolated values of shape (points, columns).
+        """
+        brackets = [self._linear_weights(dim, values) for dim, values in enumerate(points)]
+        if point_index is None:
+            point_index = [np.arange(points[0].shape[0])] * 4
+        n_points = point_index[0].shape[0]
+        if order is None:
+            order = np.arange(n_points)
+        if column_runs is None:
+            column_runs = self._column_runs(interp_data)
+        n_columns = sum(run.stop - run.start for run in column_runs)
+        interp_value = np.empty((n_points, n_columns), dtype=np.float64) if out is None else out
+
+        n_corners = 16
+        block_size = max(1, _BLOCK_BYTES // (8 * n_corners * n_columns))
+        for block_start in range(0, n_points, block_size):
+            block = order[block_start : block_start + block_size]
+            n_block = block.shape[0]
+            corner = []
+            corner_weights = np.ones((n_block, 1, 1, 1, 1), dtype=np.float64)
+            for dim, (lower, upper, weight) in enumerate(brackets):
+                rows = point_index[dim][block]
+                shape = [n_block, 1, 1, 1, 1]
+                shape[dim + 1] = 2
+                corner.append(np.broadcast_to(np.stack((lower[rows], upper[rows]), axis=-1).reshape(shape), (n_block, 2, 2, 2, 2)).reshape(n_block, -1))
+                corner_weights = corner_weights * np.stack((1.0 - weight[rows], weight[rows]), axis=-1).reshape(shape)
+            all_weights = np.broadcast_to(corner_weights, (n_block, 2, 2, 2, 2)).reshape(n_block, n_corners)
+
+            all_values = self._corner_values(interp_data, corner, column_runs, table_rows).reshape(n_block, n_corners, n_columns)
+            self._apply_cut(all_values, cut)
+            interp_value[block] = _linear_average(all_values, all_weights)
+        return interp_value
+
     def _determine_multiple(
         self: "DataSift",
         nH: Union[int, float, list, np.ndarray],
@@ -13,9 +13,6 @@ import inspect
 from pathlib import Path
 from typing import Union, Tuple, Optional, List
 
-# Third party imports
-from webdav4.client import Client
-
 # Local package imports
 from .utils import (
     LOCAL_DATA_PATH,
@@ -35,6 +32,8 @@ def download_from_server_small(
     filename: Union[str, Path],
 ) -> None:
     try:
+        from webdav4.client import Client
+
         client = Client(WEBDAV_MPCDF_URL, auth=(files_link_token, ""))
         client.download_file(from_path=os.path.basename(filename), to_path=download_location / Path(os.path.basename(filename)))
     except Exception as error:
@@ -44,6 +43,8 @@ def download_from_server_small(
 def fetch_filelist_from_url(files_link_token: str) -> List[str]:
     links = []
     try:
+        from webdav4.client import Client
+
         client = Client(WEBDAV_MPCDF_URL, auth=(files_link_token, ""))
         items = client.ls(path="/", detail=True)
         for item in items:
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+import h5py
+
+MAX_OPEN_FILES = 16
+
+
+class FilePool:
+    def __init__(
+        self: "FilePool",
+        file_path: Callable[[int], Path],
+        max_open: int = MAX_OPEN_FILES,
+    ) -> None:
+        """
+        Keeps the HDF5 batch files open across queries.
+        The least recently used file is closed once more than
+        max_open files are open.
+
+        Parameters
+        ----------
+        file_path : callable function
+            returns the path of the batch file for a batch id.
+        max_open : int, optional
+            maximum number of files kept open simultaneously.
+            The default is 16.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._file_path = file_path
+        self._files: "OrderedDict[int, h5py.File]" = OrderedDict()
+        self.max_open = max_open
+
+    @property
+    def max_open(self: "FilePool") -> int:
+        return self._max_open
+
+    @max_open.setter
+    def max_open(self: "FilePool", max_open: int) -> None:
+        if max_open < 1:
+            raise ValueError(f"Problem! At least one file must be allowed to stay open (requested {max_open}).")
+        self._max_open = int(max_open)
+        self._evict()
+
+    def get(self: "FilePool", batch_id: int) -> h5py.File:
+        """
+        Open HDF5 file of the batch (opened only if not already open).
+        """
+        batch_id = int(batch_id)
+        if batch_id in self._files:
+            self._files.move_to_end(batch_id)
+            return self._files[batch_id]
+        hdf = h5py.File(self._file_path(batch_id), "r")
+        self._files[batch_id] = hdf
+        self._evict()
+        return hdf
+
+    def _evict(self: "FilePool") -> None:
+        while len(self._files) > self._max_open:
+            _, hdf = self._files.popitem(last=False)
+            hdf.close()
+
+    def close(self: "FilePool") -> None:
+        """
+        Close all the open files.
+        """
+        while len(self._files) > 0:
+            _, hdf = self._files.popitem(last=False)
+            hdf.close()
+
+    def __contains__(self: "FilePool", batch_id: int) -> bool:
+        return int(batch_id) in self._files
+
+    def __len__(self: "FilePool") -> int:
+        return len(self._files)
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+import math
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .datasift import _BLOCK_BYTES, DataSift, _idw_average, _idw_average_floats, _linear_average, _scalar_linear_factors, _scalar_stencil
+
+
+class FrozenSlice:
+    def __init__(
+        self: "FrozenSlice",
+        table: "DataSift",
+        interp_data: str,
+        metallicity: Union[int, float],
+        redshift: Union[int, float],
+        method: str = "idw",
+        columns: Optional[Union[slice, Sequence[int], np.ndarray]] = None,
+        scaling_func: Callable = lambda x: x,
+        cut: Tuple[Optional[Union[float, int]], Optional[Union[float, int]]] = (
+            None,
+            None,
+        ),
+        single_column: bool = False,
+        result: Optional[Callable[[np.ndarray], Any]] = None,
+    ) -> None:
+        """
+        Interpolation at a fixed metallicity and redshift.
+        The table rows of the (nH, temperature) slice are read once here
+        (only from the batches covering the slice) with the cut applied,
+        and every call interpolates from memory without any file access.
+        For linear interpolation the slice is collapsed along metallicity
+        and redshift, leaving a bilinear interpolation per call.
+        The results are the same as the queries on the full table.
+
+        Parameters
+        ----------
+        table : DataSift
+            the table (Ionization or EmissionSpectrum) to interpolate.
+        interp_data : str
+            data location within HDF5 file
+        metallicity : float
+            Plasma metallicity with respect to solar.
+        redshift : float
+            Cosmological redshift of the universe.
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        columns : slice or list of int, optional
+            columns of the data to be interpolated.
+            The default is None (all columns).
+        scaling_func : callable function, optional
+            function space in which intrepolation is carried out.
+            The default is linear.
+        cut : upper and lower bound on  data
+            The default is (None, None)
+        single_column : bool, optional
+            drop the axis of the columns from the results
+            (only one column requested).
+            The default is False.
+        result : callable, optional
+            builds the value returned from the interpolated values
+            (like the spectrum of EmissionSpectrum from the emissivities).
+            The default is None (values only).
+
+        Returns
+        -------
+        None.
+
+        """
+        if not (method == "idw" or method == "linear"):
+            raise ValueError("Problem! Invalid method: %s." % method)
+        if np.ndim(metallicity) > 0 or np.ndim(redshift) > 0:
+            raise ValueError("Problem! Only a single metallicity and redshift can be frozen.")
+        self.metallicity = float(metallicity)
+        self.redshift = float(redshift)
+        self.method = method
+        self._table = table
+        self._scaling_func = scaling_func
+        self._single_column = single_column
+        self._result = result
+
+        # nodes (and their weight for linear) along metallicity and redshift, the same for every call
+        fixed_nodes: List[List[int]] = []
+        fixed_factors: List[List[float]] = []
+        for dim, value in ((2, self.metallicity), (3, self.redshift)):
+            if method == "linear":
+                lower, upper, weight = table._linear_weights(dim, np.array([value]))
+                fixed_nodes.append([int(lower[0]), int(upper[0])])
+                fixed_factors.append([1.0 - float(weight[0]), float(weight[0])])
+            else:
+                positions, exact = table._stencil_positions(dim, np.array([value]))
+                fixed_nodes.append(positions[0, : 3 if exact[0] else 2].tolist())
+                # squared distance of the nodes from the frozen value
+                axis = table._axis_lists[dim]
+                fixed_factors.append([abs(scaling_func(axis[position]) - scaling_func(value)) ** 2 for position in fixed_nodes[-1]])
+        self._fixed_factors = fixed_factors
+
+        # every node of the slice: all nH and temperature around the fixed values
+        n_nH, n_T = table.nH_data.shape[0], table.T_data.shape[0]
+        counter = np.asarray(table._get_counter(*np.ix_(np.arange(n_nH), np.arange(n_T), *[np.array(nodes) for nodes in fixed_nodes])))
+        batch_id, local_pos = table._locate_nodes(counter.reshape(-1))
+        table._ensure_batches(interp_data, batch_id)
+        column_runs = table._column_runs(interp_data, columns)
+        # (nH, temperature, metallicity, redshift, columns)
+        block = table._gather(interp_data, batch_id, local_pos, column_runs).reshape((*counter.shape, -1))
+        table._apply_cut(block, cut)
+        if method == "linear":
+            # (nH, temperature, columns) at the frozen metallicity and redshift
+            block = np.einsum("ijkmc,k,m->ijc", block, *[np.array(factors) for factors in fixed_factors])
+        self._block = block
+        # a single column (like one ion) is cheaper with plain floats than numpy
+        self._block_list = block[..., 0].tolist() if block.shape[-1] == 1 else None
+
+    @property
+    def nbytes(self: "FrozenSlice") -> int:
+        # memory held by the slice
+        return self._block.nbytes
+
+    def __call__(
+        self: "FrozenSlice",
+        nH: Union[int, float, list, np.ndarray],
+        temperature: Union[int, float, list, np.ndarray],
+    ) -> Any:
+        """
+        Interpolate at the frozen metallicity and redshift.
+
+        Parameters
+        ----------
+        nH : float, list, np.ndarray
+            Hydrogen number density
+            (all hydrogen both neutral and ionized.
+        temperature : float, list, np.ndarray
+            Plasma temperature.
+            Broadcasted against nH.
+
+        Returns
+        -------
+        np.ndarray
+            interpolated values of the broadcasted shape
+            of nH and temperature (followed by the columns),
+            or as built by result.
+
+        """
+        values = [float(argument) for argument in (nH, temperature) if isinstance(argument, (int, float, np.integer, np.floating))]
+        # non-positive values on the log axes are left to the array path
+        if len(values) == 2 and all(math.isfinite(value) and (value > 0 or self.method == "idw") for value in values):
+            scalar_value = self._interpolate_scalar(values)
+            if self._single_column and isinstance(scalar_value, float):
+                return scalar_value
+            interp_value = scalar_value if isinstance(scalar_value, np.ndarray) else np.array([scalar_value])
+        else:
+            nH = np.asarray(nH, dtype=np.float64)
+            temperature = np.asarray(temperature, dtype=np.float64)
+            shape = np.broadcast_shapes(nH.shape, temperature.shape)
+            points = [nH.reshape(-1), temperature.reshape(-1)]
+            point_index = [np.broadcast_to(np.arange(argument.size).reshape(argument.shape), shape).reshape(-1) for argument in (nH, temperature)]
+            if self.method == "linear":
+                interp_value = self._interpolate_points_linear(points, point_index)
+            else:
+                interp_value = self._interpolate_points(points, point_index)
+            interp_value = interp_value.reshape((*shape, interp_value.shape[-1]))
+
+        if self._single_column:
+            return interp_value[..., 0][()]
+        if self._result is not None:
+            return self._result(interp_value)
+        return interp_value
+
+    def _interpolate_scalar(
+        self: "FrozenSlice",
+        values: List[float],
+    ) -> Union[float, np.ndarray]:
+        """
+        Interpolate at a single (nH, temperature) with plain floats, like
+        `DataSift._interpolate_scalar` on the rows of the slice.
+        A float for a single column, otherwise the values of the columns (1d).
+        """
+        axes = self._table._axis_lists
+        neighbours = [_scalar_stencil(axis, value) for axis, value in zip(axes, values)]
+
+        if self.method == "linear":
+            factors = [
+                _scalar_linear_factors(axis, value, positions, self._table._axis_scale[dim] == "log")
+                for dim, (axis, value, positions) in enumerate(zip(axes, values, neighbours))
+            ]
+            if self._block_list is not None:
+                plane = self._block_list
+                return sum([w_i * w_j * plane[i][j] for i, w_i in factors[0] for j, w_j in factors[1]])
+            weights = [w_i * w_j for _, w_i in factors[0] for _, w_j in factors[1]]
+            all_values = self._block[np.ix_([i for i, _ in factors[0]], [j for j, _ in factors[1]])].reshape(1, len(weights), -1)
+            return _linear_average(all_values, np.array([weights]))[0]
+
+        # corners in the same order as the full table (product of i, j, k, m)
+        scaling_func = self._scaling_func
+        squared = [
+            [abs(scaling_func(axis[position]) - scaling_func(value)) ** 2 for position in positions] for axis, value, positions in zip(axes, values, neighbours)
+        ]
+        corner_dist_sq = []
+        for f_i in squared[0]:
+            for f_j in squared[1]:
+                w_j = 0.0 + f_i + f_j
+                for f_k in self._fixed_factors[0]:
+                    for f_m in self._fixed_factors[1]:
+                        corner_dist_sq.append(w_j + f_k + f_m)
+
+        if self._block_list is not None:
+            block = self._block_list
+            corner_values = [value for i in neighbours[0] for j in neighbours[1] for row in block[i][j] for value in row]
+            return _idw_average_floats(corner_values, corner_dist_sq)
+        all_values = self._block[np.ix_(neighbours[0], neighbours[1])].reshape(1, len(corner_dist_sq), -1)
+        return _idw_average(all_values, np.array([corner_dist_sq]))[0]
+
+    def _interpolate_points(
+        self: "FrozenSlice",
+        points: List[np.ndarray],
+        point_index: List[np.ndarray],
+    ) -> np.ndarray:
+        """
+        Inverse distance weighted interpolation of all the requested points at once,
+        grouped by the shape of their stencil along nH and temperature like
+        `DataSift._interpolate_points`. Returns the values of shape (points, columns).
+        """
+        table = self._table
+        scaling_func = self._scaling_func
+        stencils = [table._stencil_positions(dim, values) for dim, values in enumerate(points)]
+        distances = [
+            np.abs(scaling_func(table._axes[dim][positions]) - scaling_func(values)[:, np.newaxis]) ** 2
+            for dim, (values, (positions, _)) in enumerate(zip(points, stencils))
+        ]
+        fixed_squared = [np.array(factors) for factors in self._fixed_factors]
+        n_points = point_index[0].shape[0]
+        n_columns = self._block.shape[-1]
+        interp_value = np.empty((n_points, n_columns), dtype=np.float64)
+
+        stencil_kind = stencils[0][1][point_index[0]].astype(np.int64) + 2 * stencils[1][1][point_index[1]].astype(np.int64)
+        for kind in np.unique(stencil_kind):
+            members = np.flatnonzero(stencil_kind == kind)
+            width = [3 if (kind >> dim) & 1 else 2 for dim in range(2)]
+            n_corners = width[0] * width[1] * fixed_squared[0].shape[0] * fixed_squared[1].shape[0]
+            block_size = max(1, _BLOCK_BYTES // (8 * n_corners * n_columns))
+            for block_start in range(0, members.shape[0], block_size):
+                block = members[block_start : block_start + block_size]
+                rows = [point_index[dim][block] for dim in range(2)]
+                positions = [stencils[dim][0][rows[dim], : width[dim]] for dim in range(2)]
+                # corners in the same order as product(i_vals, j_vals, k_vals, m_vals)
+                all_values = self._block[positions[0][:, :, np.newaxis], positions[1][:, np.newaxis, :]].reshape(block.shape[0], n_corners, n_columns)
+                corner_dist_sq = (
+                    0.0
+                    + distances[0][rows[0], : width[0], np.newaxis, np.newaxis, np.newaxis]
+                    + distances[1][rows[1], np.newaxis, : width[1], np.newaxis, np.newaxis]
+                    + fixed_squared[0][:, np.newaxis]
+                    + fixed_squared[1]
+                )
+                interp_value[block] = _idw_average(all_values, corner_dist_sq.reshape(block.shape[0], n_corners))
+        return interp_value
+
+    def _interpolate_points_linear(
+        self: "FrozenSlice",
+        points: List[np.ndarray],
+        point_index: List[np.ndarray],
+    ) -> np.ndarray:
+        # bilinear interpolation of all the requested points on the collapsed slice, of shape (points, columns)
+        (i_lower, i_upper, w_i), (j_lower, j_upper, w_j) = [self._table._linear_weights(dim, values) for dim, values in enumerate(points)]
+        n_points = point_index[0].shape[0]
+        n_columns = self._block.shape[-1]
+        interp_value = np.empty((n_points, n_columns), dtype=np.float64)
+
+        n_corners = 4
+        block_size = max(1, _BLOCK_BYTES // (8 * n_corners * n_columns))
+        for block_start in range(0, n_points, block_size):
+            block = np.arange(block_start, min(block_start + block_size, n_points))
+            i, j = point_index[0][block], point_index[1][block]
+            # corners in the same order as product(i_vals, j_vals)
+            corner_i = np.stack((i_lower[i], i_lower[i], i_upper[i], i_upper[i]), axis=-1)
+            corner_j = np.stack((j_lower[j], j_upper[j], j_lower[j], j_upper[j]), axis=-1)
+            all_weights = np.stack(((1.0 - w_i[i]) * (1.0 - w_j[j]), (1.0 - w_i[i]) * w_j[j], w_i[i] * (1.0 - w_j[j]), w_i[i] * w_j[j]), axis=-1)
+            interp_value[block] = _linear_average(self._block[corner_i, corner_j], all_weights)
+        return interp_value
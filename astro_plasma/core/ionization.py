@@ -4,8 +4,10 @@
 """
 
 # Built-in imports
+from contextlib import nullcontext
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Optional, Union
+from typing import Any, Optional, Union, List, Tuple, Dict, Iterable, Iterator, Sequence, NamedTuple
 import os
 
 # Third party imports
@@ -15,6 +17,11 @@ import numpy as np
 # Local package imports
 from .constants import mH, mp, X_solar, Y_solar, Z_solar, Xp, Yp, Zp
 from .datasift import DataSift
+from .file_pool import MAX_OPEN_FILES
+from .batch_cache import BatchCache
+from .frozen import FrozenSlice
+from .manifest import read_manifest
+from .streaming import STREAM_CHUNK_BYTES, Points, stream_query
 from .utils import LOCAL_DATA_PATH, AtmElement, parse_atomic_ion_no, should_check_or_download_data
 from .data_dir import set_base_dir
 from .download_database import download_ionization_data
@@ -23,24 +30,128 @@ DEFAULT_BASE_DIR = LOCAL_DATA_PATH / "ionization"
 FILE_NAME_TEMPLATE = "ionization.b_{:06d}.h5"
 DOWNLOAD_IN_INIT = (Path(os.path.basename(FILE_NAME_TEMPLATE.format(0))), 0)
 
+# element (0: H, 1: He, ... 29: Zn) and charge (0: neutral, 1: +, ...)
+# of each ion in the order of the ionization tables
+_ION_ELEMENT = np.concatenate([np.full(element + 2, element) for element in range(30)])
+_ION_CHARGE = np.concatenate([np.arange(element + 2) for element in range(30)])
+_ION_SLICE_H, _ION_SLICE_He, _ION_SLICE_METALS = slice(0, 2), slice(2, 5), slice(5, None)
+
+# particles contributed by each ion for the different part_type
+_PART_TYPE_WEIGHTS = {
+    "all": (_ION_CHARGE + 1).astype(np.float64),  # electrons + the ion itself
+    "electron": _ION_CHARGE.astype(np.float64),
+    "neutral": (_ION_CHARGE == 0).astype(np.float64),
+    # ions of metals are counted with their charge
+    "ion": np.where(_ION_ELEMENT < 2, _ION_CHARGE > 0, _ION_CHARGE).astype(np.float64),
+}
+
+
+@lru_cache(maxsize=None)
+def _solar_abundance() -> np.ndarray:
+    # number abundance relative to hydrogen of the elements till Zinc
+    # parsed only once per process and shared read-only
+    abn_file = LOCAL_DATA_PATH / "solar_GASS10.abn"
+    with abn_file.open() as file:
+        abn = np.array([float(element.split()[-1]) for element in file.readlines()[2:32]])  # Till Zinc
+    abn.flags.writeable = False
+    return abn
+
+
+@lru_cache(maxsize=256, typed=True)
+def _parse_species(
+    element: Union[int, AtmElement, str],
+    ion: Optional[int] = None,
+) -> Tuple[int, Optional[int]]:
+    # atomic number and ion of a species, parsed and checked once per species
+    _element, _ion = parse_atomic_ion_no(element, ion)
+
+    # _element = 1: H, 2: He, 3: Li, ... 30: Zn
+    # _ion = 1 : neutral, 2: +, 3: ++ .... (_element+1): (++++... _element times)
+    if _ion is not None:
+        if _ion < 0 or _ion > _element + 1:
+            raise ValueError(f"Problem! Invalid ion {_ion} for element {_element}.")
+    if _element < 0 or _element > 30:
+        raise ValueError(f"Problem! Invalid element {_element}.")
+    return (_element, _ion)
+
+
+class PlasmaState(NamedTuple):
+    """
+    Number densities and mean particle mass of the plasma
+    from a single interpolation of the ionization fractions.
+    """
+
+    ne: Union[float, np.ndarray]  # electron number density
+    ni: Union[float, np.ndarray]  # ion number density
+    n_neutral: Union[float, np.ndarray]  # neutral number density
+    n_total: Union[float, np.ndarray]  # total number density (all particles)
+    mu: Union[float, np.ndarray]  # mean particle mass
+
 
 class Ionization(DataSift):
     def __init__(
         self: "Ionization",
         base_dir: Optional[Path] = DEFAULT_BASE_DIR,
+        max_open_files: int = MAX_OPEN_FILES,
+        cache_bytes: int = 0,
+        abundance: Optional[Union[List[float], np.ndarray]] = None,
     ):
         """
         Prepares the location to read data for generating ionization calculations.
 
+        Parameters
+        ----------
+        base_dir : Path, optional
+            directory with the database files.
+            The default is the data directory of the package.
+        max_open_files : int, optional
+            number of database files kept open between queries.
+            The least recently used file is closed beyond this.
+            The default is 16.
+        cache_bytes : int, optional
+            memory budget (in bytes) for keeping decoded database
+            arrays in memory between queries. The cache is available
+            as the batch_cache attribute and can be shared between objects.
+            It also keeps the table rows around recent single point
+            queries, which are otherwise read from the files every call.
+            The default is 0 (no caching).
+        abundance : list, np.ndarray, optional
+            number abundance relative to hydrogen of the elements
+            from H to Zn (30 values) used for the number densities.
+            The default is None (solar abundances of Grevesse et al. 2010).
+
         Returns
         -------
         None.
 
         """
         self._check_and_download = download_ionization_data
-        self.file_name_template = FILE_NAME_TEMPLATE
+        self.max_open_files = max_open_files
+        self.batch_cache = BatchCache(cache_bytes)
+        self.abundance = abundance
         self.base_dir = base_dir
 
+    @property
+    def abundance(self: "Ionization") -> np.ndarray:
+        return _solar_abundance() if self._abundance is None else self._abundance
+
+    @abundance.setter
+    def abundance(
+        self: "Ionization",
+        abundance: Optional[Union[List[float], np.ndarray]] = None,
+    ) -> None:
+        # None restores the solar abundances
+        if abundance is None:
+            self._abundance = None
+            return
+        _abundance = np.array(abundance, dtype=np.float64)
+        if _abundance.shape != (30,):
+            raise ValueError(f"Problem! Abundance must be given for the 30 elements from H to Zn (got shape {_abundance.shape}).")
+        if not (np.all(np.isfinite(_abundance)) and np.all(_abundance >= 0)):
+            raise ValueError("Problem! Abundances must be finite and non-negative.")
+        _abundance.flags.writeable = False
+        self._abundance = _abundance
+
     @property
     def base_dir(self):
         return self._base_dir
@@ -52,9 +163,13 @@ class Ionization(DataSift):
     ):
         self._base_dir = set_base_dir(DEFAULT_BASE_DIR, base_dir)
 
-        if should_check_or_download_data():
+        # the manifest of the table saves opening batch 0 (and its download check)
+        manifest = read_manifest(self._base_dir)
+        # tiled tables name their files differently
+        self.file_name_template = FILE_NAME_TEMPLATE if manifest is None else manifest.file_name_template
+        if manifest is None and should_check_or_download_data():
             self._check_and_download(initialize=True)
-        with h5py.File(self._base_dir / DOWNLOAD_IN_INIT[0], "r") as data:
+        with h5py.File(self._base_dir / DOWNLOAD_IN_INIT[0], "r") if manifest is None else nullcontext(manifest) as data:
             super().__init__(self, data)
 
     def _get_file_path(self: "Ionization", batch_id: int) -> Path:
@@ -67,6 +182,9 @@ class Ionization(DataSift):
         metallicity: Union[int, float] = 0.5,
         redshift: Union[int, float] = 0.2,
         mode: str = "PIE",
+        method: str = "idw",
+        columns: Optional[Union[slice, List[int], np.ndarray]] = None,
+        out: Optional[np.ndarray] = None,
     ) -> np.ndarray:
         """
         Interpolates the ionization fraction of the plasma
@@ -77,7 +195,8 @@ class Ionization(DataSift):
         multiply with the abundance fraction of the element.
         Solar values are provided in a table in this repo.
         Other metallicities with respect to Solar can be simply scaled.
-        This function calculates the ionization fraction of all species.
+        This function calculates the ionization fraction of all species
+        (or only of the species in columns).
 
         Parameters
         ----------
@@ -98,6 +217,20 @@ class Ionization(DataSift):
             ionization condition
             either CIE (collisional) or PIE (photo).
             The default is 'PIE'.
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        columns : slice or list of int, optional
+            positions of the species in the list of all ions
+            (H I, H II, He I, He II, He III, Li I, ...).
+            The default is None (all species).
+        out : np.ndarray, optional
+            buffer of the result (from `_result_buffer`) the
+            ionization fractions are written into.
+            The default is None (new array).
 
         Returns
         -------
@@ -108,10 +241,7 @@ class Ionization(DataSift):
             The value is in log10.
 
         """
-        ion_count = 0
-        for i in range(30):  # Till Zn
-            for j in range(i + 2):
-                ion_count += 1
+        ion_count = _ION_ELEMENT.shape[0]  # all ions till Zn
 
         # element = 1: H, 2: He, 3: Li, ... 30: Zn
         # ion = 1 : neutral, 2: +, 3: ++ .... (element+1): (++++... element times)
@@ -126,9 +256,49 @@ class Ionization(DataSift):
             (ion_count,),
             lambda x: x,
             (None, None),
+            method,
+            columns,
+            out,
         )
         return fracIon
 
+    def _species_columns(
+        self: "Ionization",
+        element: Union[int, AtmElement, str],
+        ion: Optional[int] = None,
+    ) -> Tuple[np.ndarray, bool]:
+        """
+        Positions of the species in the list of all ions.
+        Either all the ions of the element or only the requested ion.
+
+        Parameters
+        ----------
+        element : int, AtmElement, str
+            Atomic number, symbol or name of the element
+            or the ion species in spectroscopic notation (like OVI).
+        ion : int, optional
+            Ionization species of the element.
+            The default is None (all ions of the element).
+
+        Returns
+        -------
+        tuple
+            positions of the columns and
+            whether a single ion is requested.
+
+        """
+        _element, _ion = _parse_species(element, ion)
+
+        # Select only the ions for the requested _element
+        slice_start = int((_element - 1) * (_element + 2) / 2)
+        slice_stop = int(_element * (_element + 3) / 2)
+
+        columns = np.arange(slice_start, slice_stop)
+        if _ion is not None:
+            # Array starts from 0 but _ion from 1
+            columns = columns[[_ion - 1]]
+        return (columns, _ion is not None)
+
     def interpolate_ion_frac(
         self: "Ionization",
         nH: Union[int, float] = 1.2e-4,
@@ -139,7 +309,11 @@ class Ionization(DataSift):
         ion: Optional[int] = None,
         mode: str = "PIE",
         all_ions: bool = False,
-    ) -> np.ndarray:
+        method: str = "idw",
+        grid: bool = False,
+        out: Optional[np.ndarray] = None,
+        dtype: Optional[Union[str, type, np.dtype]] = None,
+    ) -> Union[float, np.ndarray]:
         """
         Interpolates the ionization fraction of the plasma
         from pre-computed Cloudy models of ion networks.
@@ -179,6 +353,29 @@ class Ionization(DataSift):
         all_ions: bool, optional
             Output the ionization state of all ions
             The default is False
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        grid : bool, optional
+            Interpolate on the grid of all the combinations of the
+            values of the array arguments (each one 1d), like np.meshgrid
+            with ij indexing. The result has one axis per array argument
+            in the order nH, temperature, metallicity, redshift.
+            With method='linear' the weights are computed once per axis
+            and contracted axis by axis (cost scales with the size of the
+            result); with idw the points of the grid are interpolated
+            one by one as for grid=False.
+            The default is False.
+        out : np.ndarray, optional
+            buffer with the shape of the result to write it into
+            (and returned), to be reused across repeated calls.
+            The default is None (new array).
+        dtype : str, type or np.dtype, optional
+            data type of the result, like np.float32.
+            The default is None (float64 or the dtype of out).
 
         Returns
         -------
@@ -189,46 +386,157 @@ class Ionization(DataSift):
             The value is in log10.
 
         """
+        if grid:
+            nH, temperature, metallicity, redshift = self._grid_arguments(nH, temperature, metallicity, redshift)
 
         _is_multiple = self._determine_multiple(nH, temperature, metallicity, redshift, mode)
 
+        # the interpolation writes straight into out (or a buffer of dtype)
         if all_ions:
-            fracIon = self._interpolate_ion_frac_all(nH, temperature, metallicity, redshift, mode)
+            buffer = self._result_buffer(nH, temperature, metallicity, redshift, mode, _ION_ELEMENT.shape[0], out, dtype)
+            fracIon = self._interpolate_ion_frac_all(nH, temperature, metallicity, redshift, mode, method, out=buffer)
             if _is_multiple:
-                return fracIon.flatten().reshape((*self._input_shape, fracIon.shape[-1]))
+                return self._write_output(fracIon.reshape((*self._input_shape, fracIon.shape[-1])), out, dtype, buffer)
             else:
-                return fracIon.flatten()
+                return self._write_output(fracIon.reshape(-1), out, dtype, buffer)
 
-        _element, _ion = parse_atomic_ion_no(element, ion)
+        # Only the columns of the requested ions are read and interpolated
+        columns, single_ion = self._species_columns(element, ion)
+        buffer = self._result_buffer(nH, temperature, metallicity, redshift, mode, None if single_ion else columns.size, out, dtype)
+        # the ions of an element are consecutive: read as a single run
+        fracIon = self._interpolate_ion_frac_all(nH, temperature, metallicity, redshift, mode, method, slice(columns[0], columns[-1] + 1), buffer)
 
-        # _element = 1: H, 2: He, 3: Li, ... 30: Zn
-        # _ion = 1 : neutral, 2: +, 3: ++ .... (_element+1): (++++... _element times)
-        if _ion is not None:
-            if _ion < 0 or _ion > _element + 1:
-                raise ValueError(f"Problem! Invalid ion {_ion} for element {_element}.")
-        if _element < 0 or _element > 30:
-            raise ValueError(f"Problem! Invalid element {_element}.")
+        if _is_multiple:
+            if single_ion:
+                fracIon = fracIon.reshape(self._input_shape)  # This is in log10
+            else:
+                fracIon = fracIon.reshape((*self._input_shape, columns.size))
+        else:
+            fracIon = fracIon.reshape(-1)
+            fracIon = fracIon[0] if single_ion else fracIon  # This is in log10
+        return self._write_output(fracIon, out, dtype, buffer)
 
-        # Select only the ions for the requested _element
-        slice_start = int((_element - 1) * (_element + 2) / 2)
-        slice_stop = int(_element * (_element + 3) / 2)
+    def interpolate_ion_frac_species(
+        self: "Ionization",
+        nH: Union[int, float] = 1.2e-4,
+        temperature: Union[int, float] = 2.7e6,
+        metallicity: Union[int, float] = 0.5,
+        redshift: Union[int, float] = 0.2,
+        species: Sequence[Union[int, AtmElement, str, Tuple[Union[int, AtmElement, str], int]]] = ("OVI",),
+        mode: str = "PIE",
+        method: str = "idw",
+        stacked: bool = False,
+        grid: bool = False,
+    ) -> Union[Dict[Union[int, AtmElement, str, Tuple[Union[int, AtmElement, str], int]], np.ndarray], np.ndarray]:
+        """
+        Interpolates the ionization fraction of several species
+        at once for the same plasma conditions.
+        The stencil and the weights are computed only once and
+        only the columns of the requested species are read.
+        Each species gives the same result as interpolate_ion_frac.
+
+        Parameters
+        ----------
+        nH : float, list, np.ndarray, optional
+            Hydrogen number density
+            (all hydrogen both neutral and ionized.
+            The default is 1.2e-4.
+        temperature : float, list, np.ndarray, optional
+            Plasma temperature.
+            The default is 2.7e6.
+        metallicity : float, list, np.ndarray, optional
+            Plasma metallicity with respect to solar.
+            The default is 0.5.
+        redshift : float, list, np.ndarray, optional
+            Cosmological redshift of the universe.
+            The default is 0.2.
+        species : list, optional
+            The species requested. Each entry is either an ion
+            in spectroscopic notation (like 'OVI'), an element
+            (atomic number, symbol or name, for all its ions)
+            or a tuple of (element, ion).
+            The default is ('OVI',).
+        mode : str, optional
+            ionization condition
+            either CIE (collisional) or PIE (photo).
+            The default is 'PIE'.
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        stacked : bool, optional
+            Return a single array with the species
+            (all ions of an element one after another)
+            along the last axis in the requested order
+            instead of a dictionary.
+            The default is False.
+        grid : bool, optional
+            Interpolate on the grid of all the combinations of the
+            values of the array arguments (each one 1d), like np.meshgrid
+            with ij indexing. The result has one axis per array argument
+            in the order nH, temperature, metallicity, redshift.
+            With method='linear' the weights are computed once per axis
+            and contracted axis by axis (cost scales with the size of the
+            result); with idw the points of the grid are interpolated
+            one by one as for grid=False.
+            The default is False.
 
+        Returns
+        -------
+        dict or np.ndarray
+            ionization fraction of each species keyed by
+            the species as requested.
+            The values are in log10.
+
+        """
+        if grid:
+            nH, temperature, metallicity, redshift = self._grid_arguments(nH, temperature, metallicity, redshift)
+
+        if len(species) == 0:
+            raise ValueError("Problem! No species requested.")
+        _is_multiple = self._determine_multiple(nH, temperature, metallicity, redshift, mode)
+
+        species_columns = [self._species_columns(*specie) if isinstance(specie, tuple) else self._species_columns(specie) for specie in species]
+        # Union of the columns of all the species read in a single pass
+        columns = np.unique(np.concatenate([specie_columns for specie_columns, _ in species_columns]))
+        fracIon = self._interpolate_ion_frac_all(nH, temperature, metallicity, redshift, mode, method, columns)
         if _is_multiple:
-            fracIon = self._interpolate_ion_frac_all(nH, temperature, metallicity, redshift, mode)
-            slices = [slice(None)] * (fracIon.ndim - 1)
-            slices.append(slice(slice_start, slice_stop))  # slice to select only ions of one element
-            fracIon = fracIon[tuple(slices)]
-            if _ion is not None:
-                # Array starts from 0 but ion from 1
-                slices = slices[:-1]
-                slices.append(slice(_ion - 1, _ion))  # slice to select a particular ion
-                return fracIon[tuple(slices)].flatten().reshape(self._input_shape)  # This is in log10
-            else:
-                return fracIon.flatten().reshape((*self._input_shape, _element + 1))
+            fracIon = fracIon.reshape((*self._input_shape, columns.size))
         else:
-            fracIon = self._interpolate_ion_frac_all(nH, temperature, metallicity, redshift, mode).flatten()[slice_start:slice_stop]
-            # Array starts from 0 but _ion from 1
-            return fracIon[_ion - 1] if _ion is not None else fracIon  # This is in log10
+            fracIon = fracIon.reshape(-1)
+
+        positions = [np.searchsorted(columns, specie_columns) for specie_columns, _ in species_columns]
+        if stacked:
+            return fracIon[..., np.concatenate(positions)]  # This is in log10
+
+        frac_species = {}
+        for specie, position, (_, single_ion) in zip(species, positions, species_columns):
+            frac_species[specie] = fracIon[..., position[0]][()] if single_ion else fracIon[..., position]
+        return frac_species  # This is in log10
+
+    def _contract_num_dens(
+        self: "Ionization",
+        fracIon: np.ndarray,
+        nH: Union[float, np.ndarray],
+        metallicity: Union[float, np.ndarray],
+        part_type: str,
+        abn: np.ndarray,
+    ) -> Union[float, np.ndarray]:
+        """
+        Number density of a particle type from the ionization
+        fraction (not in log10) of all the ions.
+        """
+        # number of particles per ion of each species weighted by its abundance
+        weights = _PART_TYPE_WEIGHTS[part_type] * abn[_ION_ELEMENT]
+        # H, He and the metals scale differently with metallicity
+        ndens = (
+            (Xp(metallicity) / X_solar) * (fracIon[..., _ION_SLICE_H] @ weights[_ION_SLICE_H])
+            + (Yp(metallicity) / Y_solar) * (fracIon[..., _ION_SLICE_He] @ weights[_ION_SLICE_He])
+            + (Zp(metallicity) / Z_solar) * (fracIon[..., _ION_SLICE_METALS] @ weights[_ION_SLICE_METALS])
+        )
+        return ndens * nH
 
     def interpolate_num_dens(
         self: "Ionization",
@@ -240,7 +548,11 @@ class Ionization(DataSift):
         part_type: Optional[str] = None,
         element: Optional[Union[int, AtmElement, str]] = None,
         ion: Optional[int] = None,
-    ) -> float:
+        method: str = "idw",
+        grid: bool = False,
+        out: Optional[np.ndarray] = None,
+        dtype: Optional[Union[str, type, np.dtype]] = None,
+    ) -> Union[float, np.ndarray]:
         """
         Interpolates the number density of different species
         or the total number density of the plasma
@@ -276,6 +588,29 @@ class Ionization(DataSift):
             Must between 1 and element+1.
             The default is 1.
             1:neutral, 2:+, 3:++, ...
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        grid : bool, optional
+            Interpolate on the grid of all the combinations of the
+            values of the array arguments (each one 1d), like np.meshgrid
+            with ij indexing. The result has one axis per array argument
+            in the order nH, temperature, metallicity, redshift.
+            With method='linear' the weights are computed once per axis
+            and contracted axis by axis (cost scales with the size of the
+            result); with idw the points of the grid are interpolated
+            one by one as for grid=False.
+            The default is False.
+        out : np.ndarray, optional
+            buffer with the shape of the result to write it into
+            (and returned), to be reused across repeated calls.
+            The default is None (new array).
+        dtype : str, type or np.dtype, optional
+            data type of the result, like np.float32.
+            The default is None (float64 or the dtype of out).
 
         Returns
         -------
@@ -283,85 +618,17 @@ class Ionization(DataSift):
             number density of the requested species.
 
         """
-        abn_file = LOCAL_DATA_PATH / "solar_GASS10.abn"
-        with abn_file.open() as file:
-            abn = np.array([float(element.split()[-1]) for element in file.readlines()[2:32]])  # Till Zinc
+        if grid:
+            nH, temperature, metallicity, redshift = self._grid_arguments(nH, temperature, metallicity, redshift)
+
+        abn = self.abundance
         # element = 1: H, 2: He, 3: Li, ... 30: Zn
         # ion = 1 : neutral, 2: +, 3: ++ .... (element+1): (++++... element times)
 
-        _is_multiple = self._determine_multiple(nH, temperature, metallicity, redshift, mode)
-        fracIon = np.power(10.0, self._interpolate_ion_frac_all(nH, temperature, metallicity, redshift, mode))
-
-        slices = [slice(None)] * (fracIon.ndim - 1)
-        if part_type == "all" and element is None:
-            ndens = 0
-            ion_count = 0
-            for element in range(30):
-                for ion in range(element + 2):
-                    slices.append(slice(ion_count, ion_count + 1))
-                    _ion_fraction = fracIon[tuple(slices)].flatten().reshape(self._input_shape) if _is_multiple else fracIon.flatten()[ion_count]
-                    slices = slices[:-1]
-                    if element + 1 == 1:  # H
-                        ndens += (ion + 1) * (Xp(metallicity) / X_solar) * abn[element] * _ion_fraction * nH
-                    elif element + 1 == 2:  # He
-                        ndens += (ion + 1) * (Yp(metallicity) / Y_solar) * abn[element] * _ion_fraction * nH
-                    else:
-                        ndens += (ion + 1) * (Zp(metallicity) / Z_solar) * abn[element] * _ion_fraction * nH
-                    ion_count += 1
-            return ndens
-
-        elif part_type == "electron" and element is None:
-            ne = 0
-            ion_count = 0
-            for element in range(30):
-                for ion in range(element + 2):
-                    slices.append(slice(ion_count, ion_count + 1))
-                    _ion_fraction = fracIon[tuple(slices)].flatten().reshape(self._input_shape) if _is_multiple else fracIon.flatten()[ion_count]
-                    slices = slices[:-1]
-                    if element + 1 == 1:  # H
-                        ne += ion * (Xp(metallicity) / X_solar) * nH * abn[element] * _ion_fraction
-                    elif element + 1 == 2:  # He
-                        ne += ion * (Yp(metallicity) / Y_solar) * nH * abn[element] * _ion_fraction
-                    else:
-                        ne += ion * (Zp(metallicity) / Z_solar) * nH * abn[element] * _ion_fraction
-                    ion_count += 1
-            return ne
-
-        elif part_type == "neutral" and element is None:
-            n_neutral = 0
-            ion_count = 0
-            for element in range(30):
-                for ion in range(element + 2):
-                    slices.append(slice(ion_count, ion_count + 1))
-                    _ion_fraction = fracIon[tuple(slices)].flatten().reshape(self._input_shape) if _is_multiple else fracIon.flatten()[ion_count]
-                    slices = slices[:-1]
-                    if ion == 0:
-                        if element + 1 == 1:  # H
-                            n_neutral += (Xp(metallicity) / X_solar) * nH * abn[element] * _ion_fraction
-                        elif element + 1 == 2:  # He
-                            n_neutral += (Yp(metallicity) / Y_solar) * nH * abn[element] * _ion_fraction
-                        else:
-                            n_neutral += (Zp(metallicity) / Z_solar) * nH * abn[element] * _ion_fraction
-                    ion_count += 1
-            return n_neutral
-
-        elif part_type == "ion" and element is None:
-            nion = 0
-            ion_count = 0
-            for element in range(30):
-                ion_count += 1  # neglects the neutral species
-                for ion in range(1, element + 2):
-                    slices.append(slice(ion_count, ion_count + 1))
-                    _ion_fraction = fracIon[tuple(slices)].flatten().reshape(self._input_shape) if _is_multiple else fracIon.flatten()[ion_count]
-                    slices = slices[:-1]
-                    if element + 1 == 1:  # H
-                        nion += (Xp(metallicity) / X_solar) * nH * abn[element] * _ion_fraction
-                    elif element + 1 == 2:  # He
-                        nion += (Yp(metallicity) / Y_solar) * nH * abn[element] * _ion_fraction
-                    else:
-                        nion += ion * (Zp(metallicity) / Z_solar) * nH * abn[element] * _ion_fraction
-                    ion_count += 1
-            return nion
+        if element is None and part_type in _PART_TYPE_WEIGHTS:
+            _is_multiple = self._determine_multiple(nH, temperature, metallicity, redshift, mode)
+            fracIon = np.power(10.0, self._interpolate_ion_frac_all(nH, temperature, metallicity, redshift, mode, method))
+            return self._write_output(self._contract_num_dens(fracIon, np.asarray(nH) if _is_multiple else nH, metallicity, part_type, abn), out, dtype)
 
         elif element is None and part_type is None:
             raise ValueError(f"Invalid part_type: {part_type} and invalid element: {element}.")
@@ -369,10 +636,10 @@ class Ionization(DataSift):
             raise ValueError(f"Both part_type: {part_type} and element: {element} cannot be specified simultaneously.")
         else:
             _element, _ion = parse_atomic_ion_no(element, ion)
-            fIon = np.power(10.0, self.interpolate_ion_frac(nH, temperature, metallicity, redshift, _element, _ion, mode))
+            fIon = np.power(10.0, self.interpolate_ion_frac(nH, temperature, metallicity, redshift, _element, _ion, mode, method=method))
             abundance = abn[_element - 1]
             nIon = abundance * (Zp(metallicity) / Z_solar) * fIon * nH
-            return nIon
+            return self._write_output(nIon, out, dtype)
 
     def interpolate_mu(
         self: "Ionization",
@@ -382,7 +649,11 @@ class Ionization(DataSift):
         redshift: Union[int, float] = 0.2,
         mode: str = "PIE",
         part_type: str = "all",
-    ) -> float:
+        method: str = "idw",
+        grid: bool = False,
+        out: Optional[np.ndarray] = None,
+        dtype: Optional[Union[str, type, np.dtype]] = None,
+    ) -> Union[float, np.ndarray]:
         """
         Interpolates the mean particle mass of the plasma
         from pre-computed Cloudy models of ion networks.
@@ -415,6 +686,29 @@ class Ionization(DataSift):
             The type of the particle requested.
             Currently available options: all, electron, ion, neutral
             The default is 'all'.
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        grid : bool, optional
+            Interpolate on the grid of all the combinations of the
+            values of the array arguments (each one 1d), like np.meshgrid
+            with ij indexing. The result has one axis per array argument
+            in the order nH, temperature, metallicity, redshift.
+            With method='linear' the weights are computed once per axis
+            and contracted axis by axis (cost scales with the size of the
+            result); with idw the points of the grid are interpolated
+            one by one as for grid=False.
+            The default is False.
+        out : np.ndarray, optional
+            buffer with the shape of the result to write it into
+            (and returned), to be reused across repeated calls.
+            The default is None (new array).
+        dtype : str, type or np.dtype, optional
+            data type of the result, like np.float32.
+            The default is None (float64 or the dtype of out).
 
         Returns
         -------
@@ -422,5 +716,216 @@ class Ionization(DataSift):
             mean particle mass of the plasma.
 
         """
-        ndens = self.interpolate_num_dens(nH, temperature, metallicity, redshift, mode, part_type)
-        return (nH / ndens) * (mH / mp) / float(Xp(metallicity))
+        if grid:
+            nH, temperature, metallicity, redshift = self._grid_arguments(nH, temperature, metallicity, redshift)
+
+        ndens = self.interpolate_num_dens(nH, temperature, metallicity, redshift, mode, part_type, method=method)
+        # metallicity broadcasts like the other arguments
+        return self._write_output((np.asarray(nH) / ndens) * (mH / mp) / Xp(np.asarray(metallicity)), out, dtype)
+
+    def interpolate_plasma_state(
+        self: "Ionization",
+        nH: Union[int, float] = 1.2e-4,
+        temperature: Union[int, float] = 2.7e6,
+        metallicity: Union[int, float] = 0.5,
+        redshift: Union[int, float] = 0.2,
+        mode: str = "PIE",
+        method: str = "idw",
+        grid: bool = False,
+    ) -> PlasmaState:
+        """
+        Interpolates the electron, ion, neutral and total
+        number density together with the mean particle mass
+        of the plasma from a single interpolation of the
+        pre-computed Cloudy models of ion networks.
+        Same as separate calls to interpolate_num_dens
+        and interpolate_mu but at the cost of only one.
+
+        Parameters
+        ----------
+        nH : float, list, np.ndarray, optional
+            Hydrogen number density
+            (all hydrogen both neutral and ionized.
+            The default is 1.2e-4.
+        temperature : float, list, np.ndarray, optional
+            Plasma temperature.
+            The default is 2.7e6.
+        metallicity : float, list, np.ndarray, optional
+            Plasma metallicity with respect to solar.
+            The default is 0.5.
+        redshift : float, list, np.ndarray, optional
+            Cosmological redshift of the universe.
+            The default is 0.2.
+        mode : str, optional
+            ionization condition
+            either CIE (collisional) or PIE (photo).
+            The default is 'PIE'.
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        grid : bool, optional
+            Interpolate on the grid of all the combinations of the
+            values of the array arguments (each one 1d), like np.meshgrid
+            with ij indexing. The result has one axis per array argument
+            in the order nH, temperature, metallicity, redshift.
+            With method='linear' the weights are computed once per axis
+            and contracted axis by axis (cost scales with the size of the
+            result); with idw the points of the grid are interpolated
+            one by one as for grid=False.
+            The default is False.
+
+        Returns
+        -------
+        PlasmaState
+            named tuple of ne, ni, n_neutral, n_total and mu.
+
+        """
+        if grid:
+            nH, temperature, metallicity, redshift = self._grid_arguments(nH, temperature, metallicity, redshift)
+
+        abn = self.abundance
+        _is_multiple = self._determine_multiple(nH, temperature, metallicity, redshift, mode)
+        fracIon = np.power(10.0, self._interpolate_ion_frac_all(nH, temperature, metallicity, redshift, mode, method))
+        _nH = np.asarray(nH) if _is_multiple else nH
+
+        ndens = {part_type: self._contract_num_dens(fracIon, _nH, metallicity, part_type, abn) for part_type in _PART_TYPE_WEIGHTS}
+        mu = (_nH / ndens["all"]) * (mH / mp) / Xp(metallicity)
+        return PlasmaState(
+            ne=ndens["electron"],
+            ni=ndens["ion"],
+            n_neutral=ndens["neutral"],
+            n_total=ndens["all"],
+            mu=mu,
+        )
+
+    def stream_ion_frac(
+        self: "Ionization",
+        points: Optional[Points] = None,
+        element: Union[int, AtmElement, str] = AtmElement.Helium,
+        ion: Optional[int] = None,
+        mode: str = "PIE",
+        all_ions: bool = False,
+        method: str = "idw",
+        chunk_size: Optional[int] = None,
+        out: Optional[Any] = None,
+        chunks: Optional[Iterable[Points]] = None,
+    ) -> Union[Iterator[np.ndarray], Any]:
+        """
+        Interpolates the ionization fraction chunk by chunk for inputs
+        too large to be held in memory with all their results at once.
+        Every chunk gives the same values as interpolate_ion_frac.
+
+        Parameters
+        ----------
+        points : tuple, optional
+            (nH, temperature, metallicity, redshift): arguments broadcasted
+            against each other and split along the leading axis
+            (np.memmap and h5py datasets are read chunk by chunk).
+            The default is None (chunks given instead).
+        element : int, optional
+            Atomic number of the element. The default is 2.
+        ion : int, optional
+            Ionization species of the element.
+            Must between 1 and element+1.
+            The default is None.
+            1:neutral, 2:+, 3:++, ...
+        mode : str, optional
+            ionization condition
+            either CIE (collisional) or PIE (photo).
+            The default is 'PIE'.
+        all_ions: bool, optional
+            Output the ionization state of all ions
+            The default is False
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        chunk_size : int, optional
+            maximum number of points interpolated at once.
+            The default is None (64 MiB of results per chunk).
+        out : array like, optional
+            sink for the results (np.ndarray, np.memmap or h5py dataset)
+            with the broadcasted shape of the arguments (followed by the ions),
+            written chunk after chunk along the leading axis.
+            The default is None.
+        chunks : iterable, optional
+            iterable yielding (nH, temperature, metallicity, redshift) tuples,
+            interpolated one after the other instead of points
+            (each one split again if larger than chunk_size).
+            The default is None.
+
+        Returns
+        -------
+        iterator of np.ndarray or out
+            without out, the ionization fraction (log10) chunk after chunk.
+            Otherwise out filled with all the results.
+
+        """
+        if not (mode == "PIE" or mode == "CIE"):
+            raise ValueError("Problem! Invalid mode: %s." % mode)
+        n_columns = _ION_ELEMENT.shape[0] if all_ions else self._species_columns(element, ion)[0].size
+        if chunk_size is None:
+            chunk_size = max(1, STREAM_CHUNK_BYTES // (8 * n_columns))
+        query = partial(self.interpolate_ion_frac, element=element, ion=ion, mode=mode, all_ions=all_ions, method=method)
+        return stream_query(query, points, chunk_size, out, chunks)
+
+    def freeze(
+        self: "Ionization",
+        metallicity: Union[int, float] = 0.5,
+        redshift: Union[int, float] = 0.2,
+        mode: str = "PIE",
+        element: Optional[Union[int, AtmElement, str]] = None,
+        ion: Optional[int] = None,
+        method: str = "idw",
+    ) -> FrozenSlice:
+        """
+        Prepares a fast interpolator of the ionization fraction
+        at a fixed metallicity and redshift. The (nH, temperature) slice
+        of the table is read into memory once, so calls from inside
+        loops have no file access. The calls take nH and temperature
+        (broadcasted against each other) and return the same values as
+        interpolate_ion_frac (or of all ions when no element is given).
+
+        Parameters
+        ----------
+        metallicity : float, optional
+            Plasma metallicity with respect to solar.
+            The default is 0.5.
+        redshift : float, optional
+            Cosmological redshift of the universe.
+            The default is 0.2.
+        mode : str, optional
+            ionization condition
+            either CIE (collisional) or PIE (photo).
+            The default is 'PIE'.
+        element : int, optional
+            Atomic number of the element.
+            The default is None (all the ions of all elements).
+        ion : int, optional
+            Ionization species of the element.
+            Must between 1 and element+1.
+            The default is None (all ions of the element).
+            1:neutral, 2:+, 3:++, ...
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+
+        Returns
+        -------
+        FrozenSlice
+            callable with arguments nH and temperature
+            returning the ionization fraction in log10.
+
+        """
+        if not (mode == "PIE" or mode == "CIE"):
+            raise ValueError("Problem! Invalid mode: %s." % mode)
+        columns, single_ion = (None, False) if element is None else self._species_columns(element, ion)
+        return FrozenSlice(self, f"output/fracIon/{mode}", metallicity, redshift, method, columns, single_column=single_ion)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Usage: python -m astro_plasma.core.manifest <table directory> [<table directory> ...]
+Writes the manifest of the tables in these directories (from the existing batch files).
+"""
+
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import h5py
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_FORMAT = 3
+# arrays in every batch file needed to set up a table (and the energies of the spectra)
+_MANIFEST_ARRAYS = (
+    "params/nH",
+    "params/temperature",
+    "params/metallicity",
+    "params/redshift",
+    "header/batch_dim",
+    "header/total_size",
+    "header/tile_dim",
+    "output/energy",
+)
+
+
+class Manifest:
+    def __init__(
+        self: "Manifest",
+        file_name_template: str,
+        arrays: Dict[str, np.ndarray],
+        datasets: Dict[str, Tuple[Tuple[int, ...], str]],
+    ) -> None:
+        """
+        Layout of a table directory: the axes and header stored in every batch
+        file and the shape and dtype of the datasets of the batches. A table
+        is set up from it without opening any batch file, like from batch 0
+        (arrays are looked up by the same names).
+
+        Parameters
+        ----------
+        file_name_template : str
+            name of the batch files, formatted with the batch id.
+        arrays : dict
+            arrays of the batch files (like 'params/nH') by their name.
+        datasets : dict
+            (shape, dtype) of the datasets of a batch file by their name.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.file_name_template = file_name_template
+        self.arrays = arrays
+        self.datasets = datasets
+
+    def __getitem__(self: "Manifest", name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def __contains__(self: "Manifest", name: str) -> bool:
+        return name in self.arrays
+
+    def n_columns(self: "Manifest", name: str) -> int:
+        # number of values stored per grid node in a dataset
+        return int(np.prod(self.datasets[name][0][1:]))
+
+
+def batch_file_template(base_dir: Union[str, Path]) -> str:
+    # name of the batch files in a table directory (from the file of batch 0)
+    first_batch = sorted(Path(base_dir).glob("*.b_000000.h5"))
+    if len(first_batch) != 1:
+        raise ValueError(f"Problem! Cannot identify the batch files in {base_dir}.")
+    return first_batch[0].name.replace("000000", "{:06d}")
+
+
+def _file_stamp(path: Path) -> List[int]:
+    # size and modification time: cheap check that a file was not replaced
+    status = path.stat()
+    return [status.st_size, status.st_mtime_ns]
+
+
+def _batch_stamps(base_dir: Path, file_name_template: str) -> Dict[str, List[int]]:
+    # stamps of all the batch files present in the directory by their name
+    pattern = file_name_template.replace("{:06d}", "[0-9]" * 6)
+    return {path.name: _file_stamp(path) for path in sorted(base_dir.glob(pattern))}
+
+
+def read_manifest(base_dir: Union[str, Path]) -> Optional[Manifest]:
+    """
+    Manifest of the table directory, None if the directory has none,
+    one of an unknown format or one that no longer matches any of the
+    batch files present when it was written (the table changed since).
+    Batch files removed since (packed tables) or added since (downloaded
+    on demand) are not checked.
+    """
+    manifest_file = Path(base_dir) / MANIFEST_NAME
+    if not manifest_file.is_file():
+        return None
+    with manifest_file.open() as file:
+        content = json.load(file)
+    if content.get("format") != MANIFEST_FORMAT:
+        return None
+    for name, stamp in content["batch_files"].items():
+        batch_file = Path(base_dir) / name
+        if batch_file.is_file() and _file_stamp(batch_file) != stamp:
+            return None
+    arrays = {name: np.array(values, dtype=content["datasets"][name][1]) for name, values in content["arrays"].items()}
+    datasets = {name: (tuple(shape), dtype) for name, (shape, dtype) in content["datasets"].items()}
+    return Manifest(content["file_name_template"], arrays, datasets)
+
+
+def write_manifest(
+    base_dir: Union[str, Path],
+    file_name_template: Optional[str] = None,
+) -> Path:
+    """
+    Write the manifest of a table directory from its batch files.
+    The size and modification time of every batch file present are
+    recorded, and the manifest is ignored once any of them changes:
+    it must be written again whenever the table is replaced or regenerated.
+
+    Parameters
+    ----------
+    base_dir : str or Path
+        directory with the batch files.
+    file_name_template : str, optional
+        name of the batch files, formatted with the batch id.
+        The default is None (from the name of the file of batch 0).
+
+    Returns
+    -------
+    Path
+        location of the manifest.
+
+    """
+    base_dir = Path(base_dir)
+    if file_name_template is None:
+        file_name_template = batch_file_template(base_dir)
+
+    arrays = {}
+    datasets = {}
+    first_batch = base_dir / file_name_template.format(0)
+    with h5py.File(first_batch, "r") as data:
+
+        def add_dataset(name: str, item: Union[h5py.Dataset, h5py.Group]) -> None:
+            if isinstance(item, h5py.Dataset):
+                datasets[name] = (list(item.shape), str(item.dtype))
+                if name in _MANIFEST_ARRAYS:
+                    arrays[name] = item[()].tolist()
+
+        data.visititems(add_dataset)
+
+    manifest_file = base_dir / MANIFEST_NAME
+    content = {
+        "format": MANIFEST_FORMAT,
+        "file_name_template": file_name_template,
+        "batch_files": _batch_stamps(base_dir, file_name_template),
+        "arrays": arrays,
+        "datasets": datasets,
+    }
+    with manifest_file.open("w") as file:
+        json.dump(content, file)
+    return manifest_file
+
+
+if __name__ == "__main__":
+    for directory in sys.argv[1:]:
+        print(f"Written {write_manifest(directory)}")
@@ -6,8 +6,10 @@ Created on Thu Dec  1 18:23:40 2022
 """
 
 # Built-in imports
+from contextlib import nullcontext
+from functools import partial
 from pathlib import Path
-from typing import Union, Optional, Callable
+from typing import Any, Iterable, Iterator, NamedTuple, Union, Optional, Callable, Sequence, Tuple
 import os
 
 # Third party imports
@@ -16,7 +18,12 @@ import numpy as np
 
 # Local package imports
 
-from .datasift import DataSift
+from .datasift import DataSift, _point_buffer
+from .file_pool import MAX_OPEN_FILES
+from .batch_cache import BatchCache
+from .frozen import FrozenSlice
+from .manifest import read_manifest
+from .streaming import STREAM_CHUNK_BYTES, Points, stream_query
 from .utils import LOCAL_DATA_PATH, should_check_or_download_data
 from .data_dir import set_base_dir
 from .download_database import download_emission_data
@@ -26,21 +33,61 @@ FILE_NAME_TEMPLATE = "emission.b_{:06d}.h5"
 DOWNLOAD_IN_INIT = (Path(os.path.basename(FILE_NAME_TEMPLATE.format(0))), 0)
 
 
+class Spectrum(NamedTuple):
+    """
+    Emission spectrum with a single energy axis shared by all the
+    points instead of repeated next to every emissivity.
+    """
+
+    energy: np.ndarray  # energy in keV of shape (E,), shared and read-only
+    emissivity: np.ndarray  # 4*pi*nu*j_nu (erg cm^-3 s^-1) of shape (..., E)
+
+    def to_columns(self: "Spectrum") -> np.ndarray:
+        # the (..., E, 2) layout with energies in column 0 and emissivities in column 1
+        columns = np.empty((*self.emissivity.shape, 2), dtype=self.emissivity.dtype)
+        columns[..., 0] = self.energy
+        columns[..., 1] = self.emissivity
+        return columns
+
+
 class EmissionSpectrum(DataSift):
+    # result of the last interpolate_spectrum
+    spectrum: Union[np.ndarray, Spectrum]
+
     def __init__(
         self: "EmissionSpectrum",
         base_dir: Optional[Union[str, Path]] = None,
+        max_open_files: int = MAX_OPEN_FILES,
+        cache_bytes: int = 0,
     ) -> None:
         """
         Prepares the location to read data for generating emisson spectrum.
 
+        Parameters
+        ----------
+        base_dir : Path, optional
+            directory with the database files.
+            The default is the data directory of the package.
+        max_open_files : int, optional
+            number of database files kept open between queries.
+            The least recently used file is closed beyond this.
+            The default is 16.
+        cache_bytes : int, optional
+            memory budget (in bytes) for keeping decoded database
+            arrays in memory between queries. The cache is available
+            as the batch_cache attribute and can be shared between objects.
+            It also keeps the table rows around recent single point
+            queries, which are otherwise read from the files every call.
+            The default is 0 (no caching).
+
         Returns
         -------
         None.
 
         """
         self._check_and_download = download_emission_data
-        self.file_name_template = FILE_NAME_TEMPLATE
+        self.max_open_files = max_open_files
+        self.batch_cache = BatchCache(cache_bytes)
         self.base_dir = Path(base_dir) if base_dir is not None else base_dir
 
     @property
@@ -54,15 +101,94 @@ class EmissionSpectrum(DataSift):
     ):
         self._base_dir = set_base_dir(DEFAULT_BASE_DIR, base_dir)
 
-        if should_check_or_download_data():
+        # the manifest of the table saves opening batch 0 (and its download check)
+        manifest = read_manifest(self._base_dir)
+        # tiled tables name their files differently
+        self.file_name_template = FILE_NAME_TEMPLATE if manifest is None else manifest.file_name_template
+        if manifest is None and should_check_or_download_data():
             self._check_and_download(initialize=True)
-        with h5py.File(self._base_dir / DOWNLOAD_IN_INIT[0], "r") as data:
+        with h5py.File(self._base_dir / DOWNLOAD_IN_INIT[0], "r") if manifest is None else nullcontext(manifest) as data:
             super().__init__(self, data)
             self._energy = data["output/energy"][()]
+            # shared by all the spectra returned without copies
+            self._energy.flags.writeable = False
 
     def _get_file_path(self: "EmissionSpectrum", batch_id: int) -> Path:
         return self.base_dir / self.file_name_template.format(batch_id)
 
+    def _energy_columns(
+        self: "EmissionSpectrum",
+        energy_range: Optional[Tuple[float, float]] = None,
+        energy_bins: Optional[Union[Sequence[float], np.ndarray]] = None,
+    ) -> Tuple[Optional[slice], Optional[np.ndarray], np.ndarray]:
+        """
+        Columns of the table to be read for an energy window or for new energy bins.
+
+        Parameters
+        ----------
+        energy_range : (float, float), optional
+            lower and upper energy (keV) of the window.
+            The default is None.
+        energy_bins : list or np.ndarray, optional
+            edges (keV, increasing) of the bins to rebin the spectrum into.
+            The default is None.
+
+        Returns
+        -------
+        (columns, rebin, energy) : (slice, np.ndarray, np.ndarray)
+            run of columns to read (None for all), matrix mapping them to the
+            bins (None without bins) and the energies of the result.
+        """
+        if energy_range is not None and energy_bins is not None:
+            raise ValueError("Problem! Either energy_range or energy_bins can be requested, not both.")
+        if energy_range is None and energy_bins is None:
+            return (None, None, self._energy)
+
+        # every table energy stands for a cell in log energy around it,
+        # cells meet half way between the neighbouring energies
+        ascending = self._energy[-1] > self._energy[0]
+        log_energy = np.log10(self._energy if ascending else self._energy[::-1])
+        middle = 0.5 * (log_energy[1:] + log_energy[:-1])
+        cell_lower = np.concatenate(([1.5 * log_energy[0] - 0.5 * log_energy[1]], middle))
+        cell_upper = np.concatenate((middle, [1.5 * log_energy[-1] - 0.5 * log_energy[-2]]))
+
+        if energy_range is not None:
+            lower, upper = np.log10(energy_range[0]), np.log10(energy_range[1])
+            inside = np.flatnonzero((log_energy >= lower) & (log_energy <= upper))
+            rebin = None
+        else:
+            edges = np.log10(np.asarray(energy_bins, dtype=np.float64))
+            if edges.ndim != 1 or edges.shape[0] < 2 or np.any(np.diff(edges) <= 0):
+                raise ValueError("Problem! energy_bins must be increasing edges of at least one bin.")
+            # a bin partly outside the table would be diluted by the missing energies
+            if edges[0] < cell_lower[0] - 1e-12 or edges[-1] > cell_upper[-1] + 1e-12:
+                raise ValueError(
+                    f"Problem! energy_bins must lie within the energies of the table ({10 ** cell_lower[0]:.4g} to {10 ** cell_upper[-1]:.4g} keV)."
+                )
+            # flux conserving: fraction of every cell (in log energy) falling in each bin
+            overlap = np.clip(
+                np.minimum(cell_upper[:, np.newaxis], edges[np.newaxis, 1:]) - np.maximum(cell_lower[:, np.newaxis], edges[np.newaxis, :-1]), 0.0, None
+            )
+            inside = np.flatnonzero(np.any(overlap > 0, axis=1))
+            rebin = overlap / np.diff(edges)[np.newaxis, :]
+        if inside.shape[0] == 0:
+            raise ValueError("Problem! No energies of the table in the requested range.")
+
+        start, stop = int(inside[0]), int(inside[-1]) + 1
+        if rebin is not None:
+            rebin = rebin[start:stop]
+            energy = np.sqrt(np.asarray(energy_bins, dtype=np.float64)[1:] * np.asarray(energy_bins, dtype=np.float64)[:-1])
+        else:
+            energy = self._energy[start:stop] if ascending else self._energy[::-1][start:stop]
+        if not ascending:
+            # back to the order of the columns in the table
+            start, stop = self._energy.shape[0] - stop, self._energy.shape[0] - start
+            if rebin is not None:
+                rebin = rebin[::-1]
+            else:
+                energy = energy[::-1]
+        return (slice(start, stop), rebin, energy)
+
     def interpolate_spectrum(
         self: "EmissionSpectrum",
         nH: Union[int, float] = 1.2e-4,
@@ -71,7 +197,14 @@ class EmissionSpectrum(DataSift):
         redshift: Union[int, float] = 0.2,
         mode: str = "PIE",
         scaling_func: Callable = lambda x: x,
-    ) -> np.ndarray:
+        method: str = "idw",
+        grid: bool = False,
+        out: Optional[np.ndarray] = None,
+        dtype: Optional[Union[str, type, np.dtype]] = None,
+        as_columns: bool = True,
+        energy_range: Optional[Tuple[float, float]] = None,
+        energy_bins: Optional[Union[Sequence[float], np.ndarray]] = None,
+    ) -> Union[np.ndarray, Spectrum]:
         """
         Interpolate emission spectrum from pre-computed Cloudy table.
 
@@ -98,6 +231,46 @@ class EmissionSpectrum(DataSift):
             function space in which intrepolation is
             carried out.
             The default is linear. log10 is another popular choice.
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        grid : bool, optional
+            Interpolate on the grid of all the combinations of the
+            values of the array arguments (each one 1d), like np.meshgrid
+            with ij indexing. The result has one axis per array argument
+            in the order nH, temperature, metallicity, redshift.
+            With method='linear' the weights are computed once per axis
+            and contracted axis by axis (cost scales with the size of the
+            result); with idw the points of the grid are interpolated
+            one by one as for grid=False.
+            The default is False.
+        out : np.ndarray, optional
+            buffer with the shape of the spectrum to write it into
+            (and returned), to be reused across repeated calls.
+            The default is None (new array).
+        dtype : str, type or np.dtype, optional
+            data type of the result, like np.float32.
+            The default is None (float64 or the dtype of out).
+        as_columns : bool, optional
+            Return the energies next to the emissivities of every point
+            in two columns. Otherwise a Spectrum with the energy axis only
+            once and the emissivities of shape (..., E) (also the shape of out).
+            The default is True.
+        energy_range : (float, float), optional
+            lower and upper energy (keV) of the spectrum, only the
+            columns of the table in this window are read and interpolated.
+            The default is None (all energies).
+        energy_bins : list or np.ndarray, optional
+            edges (keV, increasing) of the bins of the spectrum. The emissivity
+            is averaged over log energy within the bins conserving the flux
+            (multiply by ln(upper edge / lower edge) for the emissivity of the band).
+            The bins must lie within the energies of the table.
+            Only the columns of the table covering the bins are read.
+            The energies returned are the geometric centres of the bins.
+            The default is None (energies of the table).
 
         Returns
         -------
@@ -107,41 +280,184 @@ class EmissionSpectrum(DataSift):
             Column 0: Energy in keV
             Column 1: spectral energy distribution (emissivity):
             4*pi*nu*j_nu (Unit: erg cm^-3 s^-1)
+            or Spectrum (named tuple of energy and emissivity)
+            if not as_columns.
 
         """
-
-        self.spectrum = np.zeros((self._energy.shape[0], 2))
-        self.spectrum[:, 0] = self._energy
+        if grid:
+            nH, temperature, metallicity, redshift = self._grid_arguments(nH, temperature, metallicity, redshift)
 
         _is_multiple = self._determine_multiple(nH, temperature, metallicity, redshift, mode)
 
+        # only the columns of the requested energies are read from the table
+        columns, rebin, energy = self._energy_columns(energy_range, energy_bins)
+        # the emissivities are written straight into out (or a buffer of dtype);
+        # energy and emissivity interleaved as columns are copied into it instead
+        buffer = None if as_columns else self._result_buffer(nH, temperature, metallicity, redshift, mode, energy.shape[0], out, dtype)
+        emissivity, _ = super()._interpolate(
+            nH,
+            temperature,
+            metallicity,
+            redshift,
+            mode,
+            f"output/emission/{mode}/total",
+            (energy.shape[0],),
+            scaling_func,
+            (None, None),  # threshold cuts
+            method,
+            columns,
+            buffer if rebin is None else None,
+        )
+        if rebin is not None:
+            rebinned = _point_buffer(buffer, emissivity.size // emissivity.shape[-1], rebin.shape[1])
+            if rebinned is None:
+                emissivity = emissivity @ rebin
+            else:
+                emissivity = np.matmul(emissivity.reshape(rebinned.shape[0], -1), rebin, out=rebinned).reshape((*emissivity.shape[:-1], rebin.shape[1]))
         if _is_multiple:
-            spectrum, _ = super()._interpolate(
-                nH,
-                temperature,
-                metallicity,
-                redshift,
-                mode,
-                f"output/emission/{mode}/total",
-                (self.spectrum.shape[0],),
-                scaling_func,
-                (None, None),  # threshold cuts
-            )
-            spectrum = spectrum.flatten().reshape((*self._input_shape, spectrum.shape[-1]))
-            self.spectrum = np.zeros((*spectrum.shape, 2), dtype=np.float64)
-            for i in range(spectrum.shape[0]):
-                self.spectrum[i, :, 0] = self._energy
-            self.spectrum[:, :, 1] = spectrum
-        else:
-            self.spectrum[:, 1], _ = super()._interpolate(
-                nH,
-                temperature,
-                metallicity,
-                redshift,
-                mode,
-                f"output/emission/{mode}/total",
-                (self.spectrum.shape[0],),
-                scaling_func,
-                (None, None),  # threshold cuts
-            )
-        return self.spectrum
+            emissivity = emissivity.reshape((*self._input_shape, emissivity.shape[-1]))
+
+        if not as_columns:
+            self.spectrum = Spectrum(energy=energy, emissivity=np.asarray(self._write_output(emissivity, out, dtype, buffer)))
+            return self.spectrum
+        # energies and emissivities written straight into the result
+        spectrum = self._output_buffer((*emissivity.shape, 2), out, dtype)
+        spectrum[..., 0] = energy
+        spectrum[..., 1] = emissivity
+        self.spectrum = spectrum
+        return spectrum
+
+    def stream_spectrum(
+        self: "EmissionSpectrum",
+        points: Optional[Points] = None,
+        mode: str = "PIE",
+        scaling_func: Callable = lambda x: x,
+        method: str = "idw",
+        energy_range: Optional[Tuple[float, float]] = None,
+        energy_bins: Optional[Union[Sequence[float], np.ndarray]] = None,
+        chunk_size: Optional[int] = None,
+        out: Optional[Any] = None,
+        chunks: Optional[Iterable[Points]] = None,
+    ) -> Union[Iterator[np.ndarray], Any]:
+        """
+        Interpolate emission spectrum chunk by chunk for inputs
+        too large to be held in memory with all their spectra at once.
+        Every chunk gives the same values as interpolate_spectrum.
+
+        Parameters
+        ----------
+        points : tuple, optional
+            (nH, temperature, metallicity, redshift): arguments broadcasted
+            against each other and split along the leading axis
+            (np.memmap and h5py datasets are read chunk by chunk).
+            The default is None (chunks given instead).
+        mode : str, optional
+            ionization condition
+            either CIE (collisional) or PIE (photo).
+            The default is 'PIE'.
+        scaling_func : callable function, optional
+            function space in which intrepolation is
+            carried out.
+            The default is linear. log10 is another popular choice.
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        energy_range : (float, float), optional
+            lower and upper energy (keV) of the spectrum.
+            The default is None (all energies).
+        energy_bins : list or np.ndarray, optional
+            edges (keV, increasing) of the bins of the spectrum.
+            The default is None (energies of the table).
+        chunk_size : int, optional
+            maximum number of points interpolated at once.
+            The default is None (64 MiB of spectra per chunk).
+        out : array like, optional
+            sink for the spectra (np.ndarray, np.memmap or h5py dataset)
+            of shape (*broadcasted shape of the arguments, energies, 2),
+            written chunk after chunk along the leading axis.
+            The default is None.
+        chunks : iterable, optional
+            iterable yielding (nH, temperature, metallicity, redshift) tuples,
+            interpolated one after the other instead of points
+            (each one split again if larger than chunk_size).
+            The default is None.
+
+        Returns
+        -------
+        iterator of np.ndarray or out
+            without out, the spectra chunk after chunk.
+            Otherwise out filled with all the spectra.
+
+        """
+        if not (mode == "PIE" or mode == "CIE"):
+            raise ValueError("Problem! Invalid mode: %s." % mode)
+        if chunk_size is None:
+            chunk_size = max(1, STREAM_CHUNK_BYTES // (8 * 2 * self._energy_columns(energy_range, energy_bins)[2].shape[0]))
+        query = partial(self.interpolate_spectrum, mode=mode, scaling_func=scaling_func, method=method, energy_range=energy_range, energy_bins=energy_bins)
+        return stream_query(query, points, chunk_size, out, chunks)
+
+    def freeze(
+        self: "EmissionSpectrum",
+        metallicity: Union[int, float] = 0.5,
+        redshift: Union[int, float] = 0.2,
+        mode: str = "PIE",
+        scaling_func: Callable = lambda x: x,
+        method: str = "idw",
+        as_columns: bool = True,
+    ) -> FrozenSlice:
+        """
+        Prepares a fast interpolator of the emission spectrum
+        at a fixed metallicity and redshift. The (nH, temperature) slice
+        of the table is read into memory once, so calls from inside
+        loops have no file access. The calls take nH and temperature
+        (broadcasted against each other) and return the same spectrum
+        as interpolate_spectrum.
+
+        Parameters
+        ----------
+        metallicity : float, optional
+            Plasma metallicity with respect to solar.
+            The default is 0.5.
+        redshift : float, optional
+            Cosmological redshift of the universe.
+            The default is 0.2.
+        mode : str, optional
+            ionization condition
+            either CIE (collisional) or PIE (photo).
+            The default is 'PIE'.
+        scaling_func : callable function, optional
+            function space in which intrepolation is
+            carried out.
+            The default is linear. log10 is another popular choice.
+        method : str, optional
+            interpolation scheme
+            either idw (inverse distance weighted average of the
+            neighbouring nodes) or linear (quadrilinear interpolation
+            in log10 of nH, temperature, metallicity and linear in redshift).
+            The default is 'idw'.
+        as_columns : bool, optional
+            Return the energies next to the emissivities of every point
+            in two columns. Otherwise a Spectrum with the energy axis only
+            once and the emissivities of shape (..., E).
+            The default is True.
+
+        Returns
+        -------
+        FrozenSlice
+            callable with arguments nH and temperature
+            returning the spectrum.
+
+        """
+        if not (mode == "PIE" or mode == "CIE"):
+            raise ValueError("Problem! Invalid mode: %s." % mode)
+        energy = self._energy
+
+        def spectrum(emissivity: np.ndarray) -> Union[np.ndarray, Spectrum]:
+            # the energies of the table are shared by every call
+            frozen_spectrum = Spectrum(energy=energy, emissivity=emissivity)
+            return frozen_spectrum.to_columns() if as_columns else frozen_spectrum
+
+        return FrozenSlice(self, f"output/emission/{mode}/total", metallicity, redshift, method, scaling_func=scaling_func, result=spectrum)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+# default upper limit on the size of the results of a chunk
+STREAM_CHUNK_BYTES = 64 * 1024**2
+
+# nH, temperature, metallicity and redshift: numbers, lists or arrays
+# (including np.memmap and h5py datasets, read only chunk by chunk)
+Points = Tuple[Any, Any, Any, Any]
+
+
+def _argument_set(points: Any) -> Points:
+    # nH, temperature, metallicity and redshift of a query
+    if not isinstance(points, (tuple, list)) or len(points) != 4:
+        raise ValueError("Problem! Points must be given as (nH, temperature, metallicity, redshift).")
+    return (points[0], points[1], points[2], points[3])
+
+
+def _array_chunks(
+    points: Points,
+    chunk_size: int,
+) -> Iterator[Tuple[Tuple[int, ...], List[Any]]]:
+    """
+    Split the broadcasted arguments along their leading axis in chunks of
+    at most chunk_size points (at least one row of the leading axis).
+    Only the rows of the chunk are read from the arguments spanning the
+    leading axis, the others are read once and broadcasted to every chunk.
+
+    Returns
+    -------
+    iterator of (chunk_shape, arguments)
+        broadcasted shape of the chunk and its arguments.
+    """
+    shapes = [np.shape(argument) for argument in points]
+    shape = np.broadcast_shapes(*shapes)
+    if len(shape) == 0:
+        # single values: one chunk of a single point
+        yield ((1,), list(points))
+        return
+    fixed = [
+        (
+            None
+            if len(argument_shape) == len(shape) and argument_shape[0] > 1
+            else np.asarray(argument, dtype=np.float64).reshape((1,) * (len(shape) - len(argument_shape)) + argument_shape)
+        )
+        for argument, argument_shape in zip(points, shapes)
+    ]
+    rows = max(1, chunk_size // max(1, int(np.prod(shape[1:]))))
+    for start in range(0, shape[0], rows):
+        stop = min(start + rows, shape[0])
+        arguments = [np.asarray(argument[start:stop], dtype=np.float64) if values is None else values for argument, values in zip(points, fixed)]
+        yield ((stop - start, *shape[1:]), arguments)
+
+
+def _stream_chunks(
+    query: Callable[..., Any],
+    argument_sets: Iterable[Points],
+    chunk_size: int,
+    out: Optional[Any] = None,
+) -> Iterator[np.ndarray]:
+    # results of the query chunk after chunk, also written in out if given
+    position = 0
+    for chunk_shape, arguments in (chunk for points in argument_sets for chunk in _array_chunks(points, chunk_size)):
+        result = np.asarray(query(*arguments))
+        # a single point is returned without the axes of the arguments
+        point_shape = result.shape if np.prod(chunk_shape) == 1 else result.shape[len(chunk_shape) :]
+        result = result.reshape((*chunk_shape, *point_shape))
+        if out is not None:
+            out[position : position + chunk_shape[0]] = result
+        position += chunk_shape[0]
+        yield result
+
+
+def stream_query(
+    query: Callable[..., Any],
+    points: Optional[Points],
+    chunk_size: int,
+    out: Optional[Any] = None,
+    chunks: Optional[Iterable[Points]] = None,
+) -> Union[Iterator[np.ndarray], Any]:
+    """
+    Evaluate a query chunk by chunk. The memory held at any time is bounded by
+    the chunk size, independent of the total number of points.
+
+    Parameters
+    ----------
+    query : callable function
+        interpolation taking nH, temperature, metallicity and redshift.
+    points : tuple or None
+        the 4 arguments (broadcasted against each other and split along
+        the leading axis), None when chunks is given.
+    chunk_size : int
+        maximum number of points interpolated at once.
+    out : array like, optional
+        sink for the results, written chunk after chunk along its leading axis
+        (np.ndarray, np.memmap as from np.lib.format.open_memmap or h5py dataset).
+        The default is None.
+    chunks : iterable, optional
+        iterable yielding tuples of the 4 arguments instead of points
+        (each one split again if larger than chunk_size).
+        The default is None.
+
+    Returns
+    -------
+    iterator of np.ndarray or out
+        without out, the results of the chunks (lazily evaluated) with the shape
+        of the chunk followed by the shape of the result of a single point.
+        Otherwise out once all the chunks are written.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"Problem! Invalid chunk size {chunk_size}.")
+    if (points is None) == (chunks is None):
+        raise ValueError("Problem! Either points or chunks must be given.")
+    argument_sets = (_argument_set(item) for item in chunks) if chunks is not None else iter([_argument_set(points)])
+    results = _stream_chunks(query, argument_sets, int(chunk_size), out)
+    if out is None:
+        return results
+    for _ in results:
+        pass
+    return out
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Usage: python -m astro_plasma.core.table_store <table directory> [<table directory> ...]
+Packs the batch files of the tables in these directories in memory-mapped stores.
+"""
+
+import sys
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import h5py
+import numpy as np
+
+from .manifest import MANIFEST_NAME, batch_file_template, write_manifest
+
+# the datasets of a store are indexed by the position in the table
+# ((m*nZ + k)*nT + j)*nH + i, like the counter of the batch files
+STORE_PREFIX = "store."
+
+
+def store_path(base_dir: Union[str, Path], interp_data: str) -> Path:
+    # one file per dataset, like store.output.fracIon.PIE.npy
+    return Path(base_dir) / f"{STORE_PREFIX}{interp_data.replace('/', '.')}.npy"
+
+
+def open_store(base_dir: Union[str, Path], interp_data: str) -> Optional[np.ndarray]:
+    """
+    Memory map of the store of a dataset, None if the table directory has none.
+    The pages are read on demand by the OS (and kept in its page cache).
+    """
+    path = store_path(base_dir, interp_data)
+    if not path.is_file():
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def pack_table(
+    base_dir: Union[str, Path],
+    datasets: Optional[Sequence[str]] = None,
+    file_name_template: Optional[str] = None,
+) -> List[Path]:
+    """
+    Convert the batch files of a table directory in stores: a single
+    uncompressed .npy file per dataset of shape (redshift, metallicity,
+    temperature, nH, columns) that is memory mapped by the queries.
+    The manifest of the directory is written as well if missing, then
+    the table is set up and queried without any batch file.
+
+    Parameters
+    ----------
+    base_dir : str or Path
+        directory with all the batch files of the table.
+    datasets : list of str, optional
+        datasets to be packed (like 'output/fracIon/PIE').
+        The default is None (every dataset with values per grid node).
+    file_name_template : str, optional
+        name of the batch files, formatted with the batch id.
+        The default is None (from the name of the file of batch 0).
+
+    Returns
+    -------
+    list of Path
+        location of the stores.
+
+    """
+    base_dir = Path(base_dir)
+    if file_name_template is None:
+        file_name_template = batch_file_template(base_dir)
+
+    with h5py.File(base_dir / file_name_template.format(0), "r") as data:
+        grid = tuple(data[f"params/{axis}"].shape[0] for axis in ("redshift", "metallicity", "temperature", "nH"))
+        batch_size = int(np.prod(data["header/batch_dim"][()]))
+        total_size = int(np.prod(data["header/total_size"][()]))
+        node_datasets: List[str] = []
+
+        def add_dataset(name: str, item: Union[h5py.Dataset, h5py.Group]) -> None:
+            # values per grid node, not the energies shared by every node
+            if isinstance(item, h5py.Dataset) and name.startswith("output/") and item.ndim > 1:
+                node_datasets.append(name)
+
+        data.visititems(add_dataset)
+        layout = {name: (data[name].shape[1:], data[name].dtype) for name in (node_datasets if datasets is None else datasets)}
+    if int(np.prod(grid)) != total_size:
+        raise ValueError(f"Problem! The table in {base_dir} does not cover its full grid.")
+
+    n_batches = -(-total_size // batch_size)
+    missing = [batch_id for batch_id in range(n_batches) if not (base_dir / file_name_template.format(batch_id)).is_file()]
+    if len(missing) > 0:
+        raise ValueError(f"Problem! {len(missing)} batch files missing in {base_dir} (first: {file_name_template.format(missing[0])}).")
+
+    paths = []
+    for name, (column_shape, dtype) in layout.items():
+        path = store_path(base_dir, name)
+        # written aside and renamed once complete: a store is never read half written
+        partial = path.with_name(path.name + ".part")
+        store = np.lib.format.open_memmap(partial, mode="w+", dtype=dtype, shape=(*grid, *column_shape))
+        flat = store.reshape((total_size, *column_shape))
+        for batch_id in range(n_batches):
+            counter = np.arange(batch_id * batch_size, min((batch_id + 1) * batch_size, total_size))
+            # row of every position in its batch file, as read by the queries
+            rows = counter % batch_size - 1
+            rows[rows < 0] = counter.shape[0] - 1
+            with h5py.File(base_dir / file_name_template.format(batch_id), "r") as data:
+                flat[counter] = data[name][()][rows]
+        store.flush()
+        del flat, store
+        partial.replace(path)
+        paths.append(path)
+
+    if not (base_dir / MANIFEST_NAME).is_file():
+        write_manifest(base_dir, file_name_template)
+    return paths
+
+
+if __name__ == "__main__":
+    for directory in sys.argv[1:]:
+        for path in pack_table(directory):
+            print(f"Written {path}")
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Usage: python -m astro_plasma.core.tiles <table directory> <tiled table directory>
+Re-batches the table of the first directory in tiles written to the second one.
+"""
+
+import sys
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import h5py
+import numpy as np
+
+from .file_pool import FilePool
+from .manifest import batch_file_template, write_manifest
+
+# tiles along nH, temperature, metallicity and redshift:
+# (nodes of the core, nodes with the halo, number of tiles)
+TileLayout = Tuple[np.ndarray, np.ndarray, np.ndarray]
+# upper limit on the nodes stored in the default tiles relative to the table
+MAX_STORAGE_FACTOR = 2.0
+
+
+def tile_layout(grid: Union[Sequence[int], np.ndarray], tile_dim: Union[Sequence[int], np.ndarray]) -> TileLayout:
+    """
+    Layout of the tiles of a table. Tile t along an axis has the core nodes
+    [t*core, (t+1)*core) and a halo of one node on both sides (shifted
+    inwards at the edges of the table, all the tiles have the same size),
+    so every stencil around a node of the core lies within the tile.
+    """
+    nodes = np.asarray(grid, dtype=np.int64)
+    core = np.minimum(np.asarray(tile_dim, dtype=np.int64), nodes)
+    if core.shape != (4,) or np.any(core < 1):
+        raise ValueError(f"Problem! Invalid tile dimensions {tuple(tile_dim)}.")
+    return (core, np.minimum(core + 2, nodes), -(-nodes // core))
+
+
+def tile_origin(layout: TileLayout, grid: Union[Sequence[int], np.ndarray], dim: int, tile: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+    # first node of the tiles along an axis
+    core, extent, _ = layout
+    return np.clip(tile * core[dim] - 1, 0, grid[dim] - extent[dim])
+
+
+def storage_factor(layout: TileLayout, grid: Union[Sequence[int], np.ndarray]) -> float:
+    # nodes stored in all the tiles (halos are duplicated) relative to the nodes of the table
+    _, extent, count = layout
+    return float(np.prod(count) * np.prod(extent) / np.prod(np.asarray(grid, dtype=np.int64)))
+
+
+def _default_tile_dim(grid: np.ndarray, batch_size: int, max_storage_factor: float = MAX_STORAGE_FACTOR) -> np.ndarray:
+    """
+    Core of the tiles storing the fewest nodes in total (the halos are
+    duplicated) among the tiles holding no more nodes than a batch.
+    When the halos of such small tiles would store more than
+    max_storage_factor times the table (small grids), the tiles are
+    the smallest ones within that factor instead.
+    """
+    # the distinct cores along an axis are ceil(n / number of tiles)
+    candidates = [np.unique(-(-n // np.arange(1, n + 1))) for n in grid]
+    core = np.stack([axis.reshape(-1) for axis in np.meshgrid(*candidates, indexing="ij")], axis=1)
+    extent = np.minimum(core + 2, grid)
+    tile_nodes = np.prod(extent, axis=1)
+    stored_nodes = np.prod(-(-grid // core), axis=1) * tile_nodes
+    # a single tile (the whole table) is always within the bound
+    bounded = stored_nodes <= max_storage_factor * np.prod(grid)
+    small = bounded & (tile_nodes <= batch_size)
+    if np.any(small):
+        best = np.lexsort((-tile_nodes, np.where(small, stored_nodes, np.iinfo(np.int64).max)))[0]
+    else:
+        best = np.lexsort((stored_nodes, np.where(bounded, tile_nodes, np.iinfo(np.int64).max)))[0]
+    return core[best]
+
+
+def retile_table(
+    base_dir: Union[str, Path],
+    tile_dir: Union[str, Path],
+    tile_dim: Optional[Sequence[int]] = None,
+    datasets: Optional[Sequence[str]] = None,
+    file_name_template: Optional[str] = None,
+    max_storage_factor: float = MAX_STORAGE_FACTOR,
+) -> Path:
+    """
+    Re-batch a table in tiles: 4-D blocks of the grid with a halo of one node.
+    Every interpolation stencil (idw or linear) is read from a single tile,
+    so sparse queries open one file per point instead of up to 16 batches.
+    The halos are stored in every tile, the size of the tiled table relative
+    to the original one is printed before writing.
+    The tiles are written with their manifest, which the table objects need
+    to read them (`Ionization(base_dir=tile_dir)`).
+
+    Parameters
+    ----------
+    base_dir : str or Path
+        directory with all the batch files of the table.
+    tile_dir : str or Path
+        directory of the tiled table (created if needed).
+    tile_dim : list of int, optional
+        nodes of the core of the tiles along nH, temperature,
+        metallicity and redshift.
+        The default is None (tiles no larger than the batches,
+        or larger ones if needed to stay within max_storage_factor).
+    datasets : list of str, optional
+        datasets to be tiled (like 'output/fracIon/PIE').
+        The default is None (every dataset with values per grid node).
+    file_name_template : str, optional
+        name of the batch files, formatted with the batch id.
+        The default is None (from the name of the file of batch 0).
+    max_storage_factor : float, optional
+        upper limit on the nodes stored in the default tiles relative
+        to the nodes of the table (ignored with tile_dim).
+        The default is 2.
+
+    Returns
+    -------
+    Path
+        location of the manifest of the tiled table.
+
+    """
+    base_dir, tile_dir = Path(base_dir), Path(tile_dir)
+    if tile_dir.resolve() == base_dir.resolve():
+        raise ValueError("Problem! The tiles must be written to another directory.")
+    if file_name_template is None:
+        file_name_template = batch_file_template(base_dir)
+    tile_name_template = file_name_template.replace(".b_", ".t_")
+
+    shared: Dict[str, np.ndarray] = {}
+    node_datasets: List[str] = []
+    with h5py.File(base_dir / file_name_template.format(0), "r") as data:
+        if "header/tile_dim" in data:
+            raise ValueError(f"Problem! The table in {base_dir} is already tiled.")
+
+        def add_dataset(name: str, item: Union[h5py.Dataset, h5py.Group]) -> None:
+            if not isinstance(item, h5py.Dataset):
+                return
+            if name.startswith("output/") and item.ndim > 1:
+                node_datasets.append(name)
+            elif name not in ("header/batch_dim", "header/batch_id"):
+                # axes, size and energies are the same in every file
+                shared[name] = item[()]
+
+        data.visititems(add_dataset)
+        layout = {
+            name: (data[name].shape[1:], data[name].dtype, data[name].compression, data[name].compression_opts)
+            for name in (node_datasets if datasets is None else datasets)
+        }
+        batch_size = int(np.prod(data["header/batch_dim"][()]))
+    grid = np.array([shared[f"params/{axis}"].shape[0] for axis in ("nH", "temperature", "metallicity", "redshift")], dtype=np.int64)
+    total_size = int(np.prod(grid))
+
+    n_batches = -(-total_size // batch_size)
+    missing = [batch_id for batch_id in range(n_batches) if not (base_dir / file_name_template.format(batch_id)).is_file()]
+    if len(missing) > 0:
+        raise ValueError(f"Problem! {len(missing)} batch files missing in {base_dir} (first: {file_name_template.format(missing[0])}).")
+
+    tiles = tile_layout(grid, _default_tile_dim(grid, batch_size, max_storage_factor) if tile_dim is None else tile_dim)
+    core, extent, count = tiles
+    print(f"Tiling {base_dir} in {int(np.prod(count))} files of {tuple(extent.tolist())} nodes ({storage_factor(tiles, grid):.2f}x the size of the table)")
+    tile_dir.mkdir(parents=True, exist_ok=True)
+    batch_files = FilePool(lambda batch_id: base_dir / file_name_template.format(batch_id))
+    # tiles in the order of the table counter (redshift slowest, nH fastest)
+    for tile_id, tile in enumerate(product(*[range(n_tiles) for n_tiles in count[::-1]])):
+        nodes = [np.arange(extent[dim]) + tile_origin(tiles, grid, dim, tile[3 - dim]) for dim in range(4)]
+        m, k, j, i = np.ix_(*nodes[::-1])
+        counter = ((m * grid[2] + k) * grid[1] + j) * grid[0] + i
+        counter = counter.reshape(-1)
+        # batch and row of the nodes in the batch files (as read by the queries)
+        batch_id = counter // batch_size
+        local_pos = counter % batch_size - 1
+        rows_in_batch = np.minimum(batch_size, total_size - batch_id * batch_size)
+        local_pos = np.where(local_pos < 0, rows_in_batch - 1, local_pos)
+
+        with h5py.File(tile_dir / tile_name_template.format(tile_id), "w") as tile_file:
+            for name, values in shared.items():
+                tile_file.create_dataset(name, data=values)
+            tile_file.create_dataset("header/batch_id", data=tile_id)
+            tile_file.create_dataset("header/batch_dim", data=extent)
+            tile_file.create_dataset("header/tile_dim", data=core)
+            for name, (column_shape, dtype, compression, compression_opts) in layout.items():
+                values = np.empty((counter.shape[0], *column_shape), dtype=dtype)
+                for this_batch in np.unique(batch_id):
+                    in_batch = batch_id == this_batch
+                    rows, inverse = np.unique(local_pos[in_batch], return_inverse=True)
+                    values[in_batch] = batch_files.get(this_batch)[name][rows][inverse.reshape(-1)]
+                tile_file.create_dataset(name, data=values, compression=compression, compression_opts=compression_opts)
+    batch_files.close()
+    return write_manifest(tile_dir, tile_name_template)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    print(f"Written {retile_table(sys.argv[1], sys.argv[2])}")
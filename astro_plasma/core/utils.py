@@ -7,6 +7,7 @@ Created on Mon Jan  9 20:28:15 2023
 
 # Built-in imports
 import os
+import sys
 import re
 import hashlib
 import time
@@ -16,24 +17,33 @@ from pathlib import Path
 from typing import Tuple, Union, Optional, Sequence
 
 # Third party imports
-from webdav4.client import Client
-from dotenv import load_dotenv
-from rich.progress import (
-    Progress,
-    BarColumn,
-    DownloadColumn,
-    TransferSpeedColumn,
-    TimeRemainingColumn,
-    TextColumn,
-)
+# webdav4, rich and dotenv are imported only when needed (downloads and .env files),
+# interpolating from local data loads none of them
 from enum import Enum
 
 LOCAL_DATA_PATH = Path(__file__).parent.parent / "data"
 ROMAN_DICT = {"I": 1, "V": 5, "X": 10}
 WEBDAV_MPCDF_URL = "https://datashare.mpcdf.mpg.de/public.php/webdav/"
 
-# load env file to os.environ and can be access from os.getenv()
-load_dotenv()
+
+def _load_env_file() -> None:
+    """
+    Load the .env file to os.environ (accessed from os.getenv()).
+    It is searched like load_dotenv() does, from the directory of this module
+    (or the working directory in interactive sessions) up to the root, and
+    dotenv is imported only if there is such a file.
+    """
+    import __main__
+
+    interactive = not hasattr(__main__, "__file__") or getattr(sys, "frozen", False)
+    start = Path.cwd() if interactive else Path(__file__).resolve().parent
+    if any((directory / ".env").is_file() for directory in (start, *start.parents)):
+        from dotenv import load_dotenv
+
+        load_dotenv()
+
+
+_load_env_file()
 
 # download chunk size, # bytes to download at a time
 CHUNK_SIZE_MIN = int(os.getenv("CHUNK_SIZE_MIN", "128")) * 1024
@@ -152,6 +162,16 @@ def fetch_webdav(token: str, files: Sequence[Tuple[Union[str, Path], int]], base
     if not (isinstance(base_dir, Path)):
         base_dir = Path(base_dir)
     base_dir.mkdir(mode=0o766, parents=True, exist_ok=True)
+    from webdav4.client import Client
+    from rich.progress import (
+        Progress,
+        BarColumn,
+        DownloadColumn,
+        TransferSpeedColumn,
+        TimeRemainingColumn,
+        TextColumn,
+    )
+
     client = Client(WEBDAV_MPCDF_URL, auth=(token, ""))
 
     progress = Progress(
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Usage: python import_time.py
+Cold import time of AstroPlasma, each measured in a fresh interpreter
+as paid by every MPI rank or short-lived worker.
+"""
+
+import subprocess
+import sys
+import numpy as np
+
+n_runs = 20
+statements = {
+    "import astro_plasma": "import astro_plasma",
+    # deferred to the first use of the package
+    "from astro_plasma import ion": "from astro_plasma import ion",
+}
+
+for label, statement in statements.items():
+    elapsed = []
+    for run in range(n_runs):
+        timer = f"import time; t_start = time.perf_counter(); {statement}; print(time.perf_counter() - t_start)"
+        output = subprocess.run([sys.executable, "-c", timer], capture_output=True, text=True, check=True)
+        elapsed.append(float(output.stdout.strip().split("\n")[-1]))
+    elapsed = np.array(elapsed) * 1.0e3
+    print(f"{label:>24}: median {np.median(elapsed):.1f} ms, max {np.max(elapsed):.1f} ms")
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Usage: python scalar_latency.py
+Latency of single point queries, as made by ODE right hand sides every step.
+"""
+
+# Import AstroPlasma Ionization module
+from astro_plasma import Ionization
+import numpy as np
+import time
+
+n_calls = 10000
+rng = np.random.default_rng(seed=42)
+
+## a slowly evolving cooling cloud ----------------------------------- #
+nH = 1.2e-4 * np.cumprod(1.0 + 1.0e-4 * rng.standard_normal(n_calls))
+temperature = 2.7e6 * np.cumprod(1.0 - 2.0e-4 * rng.random(n_calls))
+metallicity = 0.5
+redshift = 0.2
+# the table rows around recent points are kept in the batch cache
+Ionization.batch_cache.max_bytes = 32 * 1024**2
+
+for method in ("idw", "linear"):
+    # first call reads the table rows around the starting point
+    Ionization.interpolate_ion_frac(nH[0], temperature[0], metallicity, redshift, element="OVI", mode="PIE", method=method)
+    elapsed = []
+    for step in range(n_calls):
+        t_start = time.perf_counter()
+        Ionization.interpolate_ion_frac(float(nH[step]), float(temperature[step]), metallicity, redshift, element="OVI", mode="PIE", method=method)
+        elapsed.append(time.perf_counter() - t_start)
+    elapsed = np.array(elapsed) * 1.0e6
+    print(f"{method:>6}: median {np.median(elapsed):.1f} us, 99th percentile {np.percentile(elapsed, 99):.1f} us per call")
@@ -27,6 +27,21 @@ def test_import():
         raise AssertionError
 
 
+def test_lazy_import():
+    import subprocess
+    import sys
+
+    # neither the tables nor their dependencies are loaded by the import
+    statement = "import sys, astro_plasma; assert 'h5py' not in sys.modules and 'Ionization' not in vars(astro_plasma)"
+    subprocess.run([sys.executable, "-c", statement], check=True)
+    # interpolation from local data needs neither the download client nor the progress bars
+    statement = "import sys, astro_plasma.core.ionization; assert 'webdav4' not in sys.modules and 'rich' not in sys.modules"
+    subprocess.run([sys.executable, "-c", statement], check=True)
+    # names resolved on first use are listed once
+    statement = "import astro_plasma; astro_plasma.CHECK_OR_DOWNLOAD_APLASMA_DATA; names = dir(astro_plasma); assert len(names) == len(set(names))"
+    subprocess.run([sys.executable, "-c", statement], check=True)
+
+
 def test_hash():
     import astro_plasma
     from pathlib import Path
@@ -171,3 +186,560 @@ def test_dimension():
         all_ions=True,
     )  # This value is in log10
     assert np.array(frac).shape == (*temperature.shape, 495)
+
+
+def test_bracket():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    import numpy as np
+
+    for dim, axis_data in enumerate((Ionization.nH_data, Ionization.T_data, Ionization.Z_data, Ionization.red_data)):
+        values = np.hstack(
+            (
+                axis_data,
+                np.nextafter(axis_data, np.inf),
+                np.nextafter(axis_data, -np.inf),
+                np.random.uniform(low=axis_data[0] - 1.0, high=1.5 * axis_data[-1], size=100),
+            )
+        )
+        above, exact = Ionization._bracket(dim, values)
+        assert np.all(above == np.array([np.sum(value > axis_data) for value in values]))
+        assert np.all(exact == np.array([np.sum(value == axis_data) == 1 for value in values]))
+
+
+def test_find_all_batches():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    from itertools import product
+    import numpy as np
+
+    axes = (Ionization.nH_data, Ionization.T_data, Ionization.Z_data, Ionization.red_data)
+    # random points with some on the grid nodes
+    points = [np.hstack((np.random.uniform(axis_data[0], axis_data[-1], size=50), np.random.choice(axis_data, size=10))) for axis_data in axes]
+    stencils = [Ionization._stencil_positions(dim, values) for dim, values in enumerate(points)]
+    batch_ids, point_batch = Ionization._find_all_batches(stencils)
+
+    expected = set()
+    for point in range(points[0].shape[0]):
+        neighbours = [positions[point, : (3 if exact[point] else 2)] for positions, exact in stencils]
+        corner_batches = [int(Ionization._identify_batch(i, j, k, m)) for i, j, k, m in product(*neighbours)]
+        expected.update(corner_batches)
+        assert batch_ids[point_batch[point]] == min(corner_batches)
+    assert set(batch_ids.tolist()) == expected
+
+
+def test_batch_major():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    import numpy as np
+
+    nH = np.logspace(-5, -1, 500)
+    temperature = np.hstack((np.logspace(4.2, 7.2, 400), np.full(100, Ionization.T_data[3])))
+    file_pool = Ionization._file_pool
+    files_read = []
+    get_file = file_pool.get
+    file_pool.get = lambda batch_id: files_read.append(int(batch_id)) or get_file(batch_id)
+    try:
+        Ionization.batch_major = False
+        block_by_block = Ionization.interpolate_ion_frac(nH, temperature, 0.4, 0.3, element="O", mode="PIE")
+        Ionization.batch_major = True
+        files_read.clear()
+        batch_major = Ionization.interpolate_ion_frac(nH, temperature, 0.4, 0.3, element="O", mode="PIE")
+    finally:
+        del file_pool.get
+        del Ionization.batch_major
+    # every batch file is read once
+    assert len(files_read) == len(set(files_read))
+    assert np.array_equal(block_by_block, batch_major)
+
+
+def test_broadcasting():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    import numpy as np
+
+    nH = np.logspace(-5, -1, 7)[:, np.newaxis]
+    temperature = np.logspace(4.2, 7.2, 5)[np.newaxis, :]
+    metallicity = np.array([0.2, 0.8])[:, np.newaxis, np.newaxis]
+    for method in ("idw", "linear"):
+        broadcasted = Ionization.interpolate_ion_frac(nH, temperature, metallicity, 0.3, element="OVI", mode="PIE", method=method)
+        assert broadcasted.shape == (2, 7, 5)
+        full = [argument.copy() for argument in np.broadcast_arrays(nH, temperature, metallicity)]
+        assert np.allclose(broadcasted, Ionization.interpolate_ion_frac(*full, 0.3, element="OVI", mode="PIE", method=method))
+        # mu with an array of metallicities too
+        mu = Ionization.interpolate_mu(nH, temperature, metallicity, 0.3, mode="PIE", method=method)
+        assert mu.shape == (2, 7, 5)
+        assert np.allclose(mu, Ionization.interpolate_plasma_state(nH, temperature, metallicity, 0.3, mode="PIE", method=method).mu)
+
+
+def test_grid_query():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    import numpy as np
+
+    nH = np.logspace(-5, -1, 6)
+    temperature = np.logspace(4.2, 7.2, 4)
+    redshift = [0.1, 0.5]
+    for method in ("idw", "linear"):
+        grid = Ionization.interpolate_ion_frac(nH, temperature, 0.4, redshift, element="C", mode="PIE", method=method, grid=True)
+        assert grid.shape == (6, 4, 2, 7)
+        mesh = np.meshgrid(nH, temperature, redshift, indexing="ij")
+        expected = Ionization.interpolate_ion_frac(mesh[0], mesh[1], 0.4, mesh[2], element="C", mode="PIE", method=method)
+        assert np.allclose(grid, expected)
+        assert np.allclose(grid[3, 2, 1], Ionization.interpolate_ion_frac(nH[3], temperature[2], 0.4, redshift[1], element="C", mode="PIE", method=method))
+
+
+def test_freeze():
+    # Import AstroPlasma Ionization and EmissionSpectrum modules
+    from astro_plasma import Ionization, EmissionSpectrum
+    import numpy as np
+
+    nH = np.logspace(-5, -1, 20)
+    temperature = np.logspace(4.2, 7.2, 20)
+    for method in ("idw", "linear"):
+        fOVI = Ionization.freeze(metallicity=0.4, redshift=0.3, mode="PIE", element="OVI", method=method)
+        assert np.allclose(fOVI(nH, temperature), Ionization.interpolate_ion_frac(nH, temperature, 0.4, 0.3, element="OVI", mode="PIE", method=method))
+        assert np.isclose(
+            fOVI(nH[5], temperature[7]), Ionization.interpolate_ion_frac(nH[5], temperature[7], 0.4, 0.3, element="OVI", mode="PIE", method=method)
+        )
+
+        # exactly on the grid nodes and all the ions of an element
+        on_node = (Ionization.nH_data[3], Ionization.T_data[5])
+        assert np.isclose(fOVI(*on_node), Ionization.interpolate_ion_frac(*on_node, 0.4, 0.3, element="OVI", mode="PIE", method=method))
+        fC = Ionization.freeze(metallicity=Ionization.Z_data[1], redshift=0.3, mode="PIE", element="C", method=method)
+        assert np.allclose(
+            fC(nH[5], temperature[7]), Ionization.interpolate_ion_frac(nH[5], temperature[7], Ionization.Z_data[1], 0.3, element="C", mode="PIE", method=method)
+        )
+
+        spectrum = EmissionSpectrum.freeze(metallicity=0.4, redshift=0.3, mode="PIE", method=method)
+        assert np.allclose(
+            spectrum(nH[:3], temperature[:3]), EmissionSpectrum.interpolate_spectrum(nH[:3], temperature[:3], 0.4, 0.3, mode="PIE", method=method)
+        )
+        assert np.allclose(spectrum(nH[5], temperature[7]), EmissionSpectrum.interpolate_spectrum(nH[5], temperature[7], 0.4, 0.3, mode="PIE", method=method))
+        # the energies once, shared by every call
+        emission = EmissionSpectrum.freeze(metallicity=0.4, redshift=0.3, mode="PIE", method=method, as_columns=False)(nH[:3], temperature[:3])
+        assert emission.energy.shape == (emission.emissivity.shape[-1],)
+        assert np.allclose(emission.to_columns(), spectrum(nH[:3], temperature[:3]))
+
+
+def test_scalar_fast_path():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    import numpy as np
+
+    # off the grid nodes and exactly on them
+    points = [(1.37e-3, 1.3e5, 0.33, 0.45), (Ionization.nH_data[3], Ionization.T_data[5], Ionization.Z_data[1], Ionization.red_data[2])]
+    for method in ("idw", "linear"):
+        for point in points:
+            fast = Ionization.interpolate_ion_frac(*point, element="OVI", mode="PIE", method=method)
+            assert isinstance(fast, float) or np.ndim(fast) == 0
+            array = Ionization.interpolate_ion_frac(*[np.array([value]) for value in point], element="OVI", mode="PIE", method=method)
+            assert np.isclose(fast, array)
+            fast = Ionization.interpolate_ion_frac(*point, element="O", mode="PIE", method=method)
+            array = Ionization.interpolate_ion_frac(*[np.array([value]) for value in point], element="O", mode="PIE", method=method)
+            assert fast.shape == (9,) and np.allclose(fast, array)
+
+    # only the columns of the requested ion are read
+    from astro_plasma.core.ionization import Ionization as ion
+
+    table = ion(base_dir=Ionization.base_dir)
+    read_columns = []
+    gather = table._gather
+    table._gather = lambda interp_data, batch_id, local_pos, column_runs=None: read_columns.append(column_runs) or gather(
+        interp_data, batch_id, local_pos, column_runs
+    )
+    table.interpolate_ion_frac(*points[0], element="OVI", mode="PIE")
+    assert [sum(run.stop - run.start for run in runs) for runs in read_columns] == [1]
+    # nothing kept in memory without a cache budget
+    table.interpolate_ion_frac(*points[0], element="OVI", mode="PIE")
+    assert len(read_columns) == 2 and len(table.batch_cache) == 0
+    # the stencil rows are kept within the budget of the batch cache
+    table.batch_cache.max_bytes = 1024**2
+    expected = table.interpolate_ion_frac(*points[0], element="OVI", mode="PIE")
+    assert table.interpolate_ion_frac(*points[0], element="OVI", mode="PIE") == expected
+    assert len(read_columns) == 3 and 0 < table.batch_cache.nbytes <= table.batch_cache.max_bytes
+
+
+def test_stream():
+    # Import AstroPlasma Ionization and EmissionSpectrum modules
+    from astro_plasma import Ionization, EmissionSpectrum
+    import numpy as np
+    import pytest
+
+    nH = np.logspace(-5, -1, 40)
+    temperature = np.logspace(4.2, 7.2, 10).reshape(-1, 1)
+    expected = Ionization.interpolate_ion_frac(nH, temperature, 0.4, 0.3, element="O", mode="PIE")
+    chunks = list(Ionization.stream_ion_frac((nH, temperature, 0.4, 0.3), element="O", mode="PIE", chunk_size=90))
+    assert len(chunks) == 5 and chunks[0].shape == (2, 40, 9)
+    assert np.allclose(np.concatenate(chunks), expected)
+
+    # iterable of chunks written into a caller provided array
+    out = np.zeros(nH.shape)
+    points = ((nH[start : start + 15], temperature[0, 0], 0.4, 0.3) for start in range(0, nH.shape[0], 15))
+    assert Ionization.stream_ion_frac(chunks=points, element="OVI", mode="PIE", chunk_size=4, out=out) is out
+    assert np.allclose(out, Ionization.interpolate_ion_frac(nH, temperature[0, 0], 0.4, 0.3, element="OVI", mode="PIE"))
+    # exactly 4 chunks are not mistaken for the 4 arguments
+    points = tuple((nH[start : start + 10], temperature[0, 0], 0.4, 0.3) for start in range(0, nH.shape[0], 10))
+    assert np.allclose(np.concatenate(list(Ionization.stream_ion_frac(chunks=points, element="OVI", mode="PIE"))), out)
+    with pytest.raises(ValueError):
+        list(Ionization.stream_ion_frac(points, element="OVI", mode="PIE"))
+    with pytest.raises(ValueError):
+        Ionization.stream_ion_frac(element="OVI", mode="PIE")
+
+    spectra = list(EmissionSpectrum.stream_spectrum((nH[:3], 1.0e6, 0.4, 0.3), mode="PIE", chunk_size=2))
+    assert np.allclose(np.concatenate(spectra), EmissionSpectrum.interpolate_spectrum(nH[:3], 1.0e6, 0.4, 0.3, mode="PIE"))
+
+
+def test_output_buffers(monkeypatch):
+    # Import AstroPlasma Ionization and EmissionSpectrum modules
+    from astro_plasma import Ionization, EmissionSpectrum
+    import numpy as np
+    import pytest
+
+    nH = np.logspace(-5, -1, 12)
+    expected = Ionization.interpolate_ion_frac(nH, 4.2e5, 0.4, 0.3, element="OVI", mode="PIE")
+    # the interpolation writes straight into out
+    written = []
+    kernel = Ionization._interpolate_points
+    monkeypatch.setattr(Ionization, "_interpolate_points", lambda *args: written.append(kernel(*args)) or written[-1])
+    out = np.empty(nH.shape, dtype=np.float32)
+    assert Ionization.interpolate_ion_frac(nH, 4.2e5, 0.4, 0.3, element="OVI", mode="PIE", out=out) is out
+    assert np.allclose(out, expected, rtol=1e-6)
+    assert len(written) == 1 and np.shares_memory(written[0], out)
+    monkeypatch.undo()
+    # out not contiguous: the results are copied into it
+    strided = np.zeros((12, 2))
+    assert Ionization.interpolate_ion_frac(nH, 4.2e5, 0.4, 0.3, element="OVI", mode="PIE", out=strided[:, 0]).base is strided
+    assert np.allclose(strided[:, 0], expected) and np.all(strided[:, 1] == 0)
+    every_ion = Ionization.interpolate_ion_frac(nH, 4.2e5, 0.4, 0.3, all_ions=True, mode="PIE", method="linear", dtype=np.float32)
+    assert every_ion.dtype == np.float32
+    assert np.allclose(every_ion, Ionization.interpolate_ion_frac(nH, 4.2e5, 0.4, 0.3, all_ions=True, mode="PIE", method="linear"), rtol=1e-5, atol=1e-5)
+    assert Ionization.interpolate_mu(nH[0], 4.2e5, 0.4, 0.3, mode="PIE", dtype=np.float32).dtype == np.float32
+    with pytest.raises(ValueError):
+        Ionization.interpolate_num_dens(nH, 4.2e5, 0.4, 0.3, mode="PIE", part_type="electron", out=out[:5])
+
+    spectrum = np.empty((3, EmissionSpectrum._energy.shape[0], 2), dtype=np.float32)
+    assert EmissionSpectrum.interpolate_spectrum(nH[:3], 1.0e6, 0.4, 0.3, mode="PIE", out=spectrum) is spectrum
+    assert np.allclose(spectrum, EmissionSpectrum.interpolate_spectrum(nH[:3], 1.0e6, 0.4, 0.3, mode="PIE"), rtol=1e-6)
+    emissivity = np.empty((3, EmissionSpectrum._energy.shape[0]), dtype=np.float32)
+    result = EmissionSpectrum.interpolate_spectrum(nH[:3], 1.0e6, 0.4, 0.3, mode="PIE", as_columns=False, out=emissivity)
+    assert result.emissivity is emissivity and np.allclose(emissivity, spectrum[..., 1], rtol=1e-6)
+
+
+def test_spectrum_energy_axis():
+    # Import AstroPlasma EmissionSpectrum module
+    from astro_plasma import EmissionSpectrum
+    import numpy as np
+
+    nH = np.logspace(-5, -1, 4).reshape(2, 2)
+    columns = EmissionSpectrum.interpolate_spectrum(nH, 1.0e6, 0.4, 0.3, mode="PIE")
+    spectrum = EmissionSpectrum.interpolate_spectrum(nH, 1.0e6, 0.4, 0.3, mode="PIE", as_columns=False)
+    assert spectrum.energy.shape == columns.shape[-2:-1] and spectrum.emissivity.shape == columns.shape[:-1]
+    assert np.shares_memory(spectrum.energy, EmissionSpectrum._energy)
+    assert np.array_equal(spectrum.to_columns(), columns)
+
+    single = EmissionSpectrum.interpolate_spectrum(nH[0, 0], 1.0e6, 0.4, 0.3, mode="PIE", as_columns=False)
+    assert np.allclose(single.emissivity, columns[0, 0, :, 1])
+
+
+def test_energy_window():
+    # Import AstroPlasma EmissionSpectrum module
+    from astro_plasma import EmissionSpectrum
+    import numpy as np
+    import pytest
+
+    nH = np.logspace(-5, -1, 4)
+    full = EmissionSpectrum.interpolate_spectrum(nH, 1.0e6, 0.4, 0.3, mode="PIE")
+    window = EmissionSpectrum.interpolate_spectrum(nH, 1.0e6, 0.4, 0.3, mode="PIE", energy_range=(0.3, 2.0))
+    inside = (full[0, :, 0] >= 0.3) & (full[0, :, 0] <= 2.0)
+    assert np.allclose(window, full[:, inside])
+
+    # a flat spectrum stays flat after rebinning
+    columns, rebin, energy = EmissionSpectrum._energy_columns(energy_bins=np.logspace(np.log10(0.3), np.log10(2.0), 5))
+    assert energy.shape == (4,) and np.allclose(np.ones(rebin.shape[0]) @ rebin, 1.0)
+    binned = EmissionSpectrum.interpolate_spectrum(nH, 1.0e6, 0.4, 0.3, mode="PIE", energy_bins=[0.5, 1.0, 2.0], as_columns=False)
+    assert binned.emissivity.shape == (4, 2)
+
+    # bins beyond the energies of the table are refused, not diluted
+    highest = float(np.max(EmissionSpectrum._energy))
+    with pytest.raises(ValueError):
+        EmissionSpectrum.interpolate_spectrum(nH, 1.0e6, 0.4, 0.3, mode="PIE", energy_bins=[0.5 * highest, 0.8 * highest, 3.0 * highest])
+
+
+def test_manifest(tmp_path):
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    from astro_plasma.core.ionization import Ionization as ion
+    from astro_plasma.core.manifest import read_manifest, write_manifest
+    import numpy as np
+    import shutil
+
+    for batch_id in (0, 1):
+        shutil.copy(Ionization._get_file_path(batch_id), tmp_path)
+    write_manifest(tmp_path)
+    assert read_manifest(tmp_path).file_name_template == "ionization.b_{:06d}.h5"
+
+    # set up from the manifest alone
+    table = ion(base_dir=tmp_path)
+    assert table._manifest is not None and len(table._file_pool) == 0
+    for axis, expected in zip(table._axes, Ionization._axes):
+        assert np.array_equal(axis, expected) and axis.dtype == expected.dtype
+    assert (table.batch_size, table.total_size) == (Ionization.batch_size, Ionization.total_size)
+    assert table._n_columns("output/fracIon/PIE") == 495 and len(table._file_pool) == 0
+
+    # a manifest no longer matching any of the batch files is not trusted
+    for batch_id in (1, 0):
+        write_manifest(tmp_path)
+        assert read_manifest(tmp_path) is not None
+        batch_file = tmp_path / "ionization.b_{:06d}.h5".format(batch_id)
+        os.utime(batch_file, ns=(batch_file.stat().st_atime_ns, batch_file.stat().st_mtime_ns + 10**9))
+        assert read_manifest(tmp_path) is None
+        assert ion(base_dir=tmp_path)._manifest is None
+
+
+def test_table_store(tmp_path):
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    from astro_plasma.core.ionization import Ionization as ion
+    from astro_plasma.core.table_store import pack_table
+    import numpy as np
+    import pytest
+
+    # the batch files are linked, not copied
+    n_batches = -(-Ionization.total_size // Ionization.batch_size)
+    for batch_id in range(n_batches):
+        batch_file = Ionization._get_file_path(batch_id)
+        if not batch_file.is_file():
+            pytest.skip("the conversion needs all the batch files")
+        (tmp_path / batch_file.name).symlink_to(batch_file)
+    pack_table(tmp_path, datasets=["output/fracIon/PIE"])
+    table = ion(base_dir=tmp_path)
+    assert table._store("output/fracIon/PIE") is not None and table._store("output/fracIon/CIE") is None
+
+    nH = np.logspace(-4, -1, 5)
+    temperature = np.logspace(4.2, 6.5, 5)
+    for method in ("idw", "linear"):
+        expected = Ionization.interpolate_ion_frac(nH, temperature, 0.3, 0.2, element=8, all_ions=True, method=method)
+        assert np.array_equal(table.interpolate_ion_frac(nH, temperature, 0.3, 0.2, element=8, all_ions=True, method=method), expected)
+        expected = Ionization.interpolate_ion_frac(1.2e-3, 2.0e5, 0.3, 0.2, element=8, ion=6, method=method)
+        assert table.interpolate_ion_frac(1.2e-3, 2.0e5, 0.3, 0.2, element=8, ion=6, method=method) == expected
+    # served from the store without any batch file
+    assert len(table._file_pool) == 0
+
+
+def test_tiles(tmp_path):
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    from astro_plasma.core.ionization import Ionization as ion
+    from astro_plasma.core.tiles import MAX_STORAGE_FACTOR, _default_tile_dim, retile_table, storage_factor, tile_layout
+    import numpy as np
+    import pytest
+
+    # the default tiles of the emission grid (batches of 512 nodes) grow past a batch to bound the halos
+    grid = np.array([25, 25, 15, 5])
+    layout = tile_layout(grid, _default_tile_dim(grid, 512))
+    assert np.prod(layout[1]) > 512 and storage_factor(layout, grid) <= MAX_STORAGE_FACTOR
+
+    n_batches = -(-Ionization.total_size // Ionization.batch_size)
+    if not all(Ionization._get_file_path(batch_id).is_file() for batch_id in range(n_batches)):
+        pytest.skip("the conversion needs all the batch files")
+    retile_table(Ionization.base_dir, tmp_path, datasets=["output/fracIon/PIE"])
+    table = ion(base_dir=tmp_path)
+    assert table._tiles is not None and storage_factor(table._tiles, table._grid) <= MAX_STORAGE_FACTOR
+
+    nH = np.logspace(-4, -1, 5)
+    temperature = np.logspace(4.2, 6.5, 5)
+    for method in ("idw", "linear"):
+        expected = Ionization.interpolate_ion_frac(nH, temperature, 0.3, 0.2, element=8, all_ions=True, method=method)
+        assert np.array_equal(table.interpolate_ion_frac(nH, temperature, 0.3, 0.2, element=8, all_ions=True, method=method), expected)
+    # every stencil is read from a single tile
+    for point in zip(nH, temperature, [0.3, 0.5, 1.0, 0.1, 0.7], [0.2, 0.0, 0.4, 1.0, 0.6]):
+        table = ion(base_dir=tmp_path)
+        expected = Ionization.interpolate_ion_frac(*point, element=8, ion=6)
+        assert table.interpolate_ion_frac(*point, element=8, ion=6) == expected
+        assert len(table._file_pool) == 1
+
+
+def test_linear_method():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    import numpy as np
+
+    i = np.random.randint(low=0, high=Ionization.nH_data.shape[0] - 1)
+    j = np.random.randint(low=0, high=Ionization.T_data.shape[0])
+    k = np.random.randint(low=0, high=Ionization.Z_data.shape[0])
+    m = np.random.randint(low=0, high=Ionization.red_data.shape[0])
+    nH = Ionization.nH_data[[i, i + 1]]
+    mode = "PIE"
+
+    node_values = Ionization.interpolate_ion_frac(
+        nH=nH,
+        temperature=np.array([Ionization.T_data[j]] * 2),
+        metallicity=np.array([Ionization.Z_data[k]] * 2),
+        redshift=np.array([Ionization.red_data[m]] * 2),
+        mode=mode,
+        all_ions=True,
+        method="linear",
+    )
+    batch_ids, local_pos = Ionization._locate_rows(np.array([i, i + 1]), np.array([j, j]), np.array([k, k]), np.array([m, m]))
+    table_values = Ionization._gather(f"output/fracIon/{mode}", batch_ids, local_pos)
+    assert np.allclose(node_values, table_values)
+
+    # half way between two nodes in log space
+    mid_value = Ionization.interpolate_ion_frac(
+        nH=np.sqrt(nH[0] * nH[1]),
+        temperature=Ionization.T_data[j],
+        metallicity=Ionization.Z_data[k],
+        redshift=Ionization.red_data[m],
+        mode=mode,
+        all_ions=True,
+        method="linear",
+    )
+    assert np.allclose(mid_value, 0.5 * (table_values[0] + table_values[1]))
+
+
+def test_ion_frac_species():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    import numpy as np
+
+    nH = np.logspace(-5, -1, 10)
+    temperature = np.logspace(4.2, 7.2, 10)
+    metallicity = 0.4
+    redshift = 0.3
+    species = ["OVI", "CIV", (8, 7), "Mg", 1]
+
+    fracIon = Ionization.interpolate_ion_frac_species(nH, temperature, metallicity, redshift, species=species, mode="PIE")
+    for specie in species:
+        expected = Ionization.interpolate_ion_frac(nH, temperature, metallicity, redshift, *(specie if isinstance(specie, tuple) else (specie,)), mode="PIE")
+        assert fracIon[specie].shape == expected.shape
+        assert np.allclose(fracIon[specie], expected)
+
+    stacked = Ionization.interpolate_ion_frac_species(nH[0], temperature[0], metallicity, redshift, species=species, mode="PIE", stacked=True)
+    assert stacked.shape == (1 + 1 + 1 + 13 + 2,)
+    assert np.isclose(stacked[0], fracIon["OVI"][0])
+
+
+def test_num_dens_contraction():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    from astro_plasma.core.constants import Xp, Yp, Zp, X_solar, Y_solar, Z_solar
+    from astro_plasma.core.utils import LOCAL_DATA_PATH
+    import numpy as np
+
+    nH = np.logspace(-5, -1, 6).reshape(2, 3)
+    temperature = np.logspace(4.2, 7.2, 6).reshape(2, 3)
+    metallicity = np.linspace(0.1, 1.5, 6).reshape(2, 3)
+    redshift = 0.3
+
+    with (LOCAL_DATA_PATH / "solar_GASS10.abn").open() as file:
+        abn = np.array([float(element.split()[-1]) for element in file.readlines()[2:32]])
+    fracIon = np.power(10.0, Ionization.interpolate_ion_frac(nH, temperature, metallicity, redshift, mode="PIE", all_ions=True))
+
+    # species by species sum
+    expected = {part_type: np.zeros_like(nH) for part_type in ("all", "electron", "ion", "neutral")}
+    ion_count = 0
+    for element in range(30):
+        scale = [Xp(metallicity) / X_solar, Yp(metallicity) / Y_solar][element] if element < 2 else Zp(metallicity) / Z_solar
+        for ion in range(element + 2):
+            ndens = scale * abn[element] * fracIon[..., ion_count] * nH
+            expected["all"] += (ion + 1) * ndens
+            expected["electron"] += ion * ndens
+            expected["neutral"] += ndens if ion == 0 else 0
+            expected["ion"] += (ion if element >= 2 else 1) * ndens if ion > 0 else 0
+            ion_count += 1
+
+    for part_type in expected:
+        ndens = Ionization.interpolate_num_dens(nH, temperature, metallicity, redshift, mode="PIE", part_type=part_type)
+        assert ndens.shape == nH.shape
+        assert np.allclose(ndens, expected[part_type])
+
+
+def test_custom_abundance():
+    from astro_plasma.core.ionization import Ionization as ion
+    from astro_plasma import Ionization
+    import numpy as np
+    import pytest
+
+    solar = Ionization.abundance
+    assert solar.shape == (30,) and not solar.flags.writeable
+
+    enhanced = ion(base_dir=Ionization.base_dir, abundance=2 * solar)
+    nO_solar = Ionization.interpolate_num_dens(1.2e-4, 4.2e5, 0.99, 0.001, mode="CIE", element="OVI")
+    nO_enhanced = enhanced.interpolate_num_dens(1.2e-4, 4.2e5, 0.99, 0.001, mode="CIE", element="OVI")
+    assert np.isclose(nO_enhanced, 2 * nO_solar)
+
+    with pytest.raises(ValueError):
+        enhanced.abundance = solar[:10]
+    with pytest.raises(ValueError):
+        enhanced.abundance = -solar
+    enhanced.abundance = None
+    assert enhanced.abundance is solar
+
+
+def test_file_pool():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    from astro_plasma.core.ionization import Ionization as ion
+    import numpy as np
+    import pytest
+
+    nH = np.logspace(-5, -1, 20)
+    temperature = np.logspace(4.2, 7.2, 20)
+    table = ion(base_dir=Ionization.base_dir)
+    expected = table.interpolate_ion_frac(nH, temperature, 0.4, 0.3, element="OVI", mode="PIE")
+    handles = dict(table._file_pool._files)
+    assert len(handles) > 0
+
+    # the same batches again: no file is reopened
+    for _ in range(3):
+        assert np.array_equal(table.interpolate_ion_frac(nH, temperature, 0.4, 0.3, element="OVI", mode="PIE"), expected)
+        assert len(table._file_pool) == len(handles)
+        assert all(table._file_pool._files[batch_id] is hdf for batch_id, hdf in handles.items())
+
+    # the least recently used file is closed beyond max_open_files
+    batch_ids = sorted(handles)
+    if len(batch_ids) < 3:
+        pytest.skip("the eviction needs a query over at least 3 batch files")
+    table.max_open_files = 2
+    pool = table._file_pool
+    assert len(pool) == 2
+    first, second, third = [pool.get(batch_id) for batch_id in batch_ids[:3]]
+    assert not first and second and third and len(pool) == 2
+    pool.get(batch_ids[1])
+    pool.get(batch_ids[0])
+    assert not third and batch_ids[2] not in pool and batch_ids[1] in pool
+    table.max_open_files = 1
+    assert np.array_equal(table.interpolate_ion_frac(nH, temperature, 0.4, 0.3, element="OVI", mode="PIE"), expected)
+    assert len(pool) == 1
+
+    # no file left open
+    handles = dict(pool._files)
+    table.close()
+    assert len(pool) == 0 and not any(handles.values())
+    with ion(base_dir=Ionization.base_dir) as table:
+        assert np.array_equal(table.interpolate_ion_frac(nH, temperature, 0.4, 0.3, element="OVI", mode="PIE"), expected)
+        handles = dict(table._file_pool._files)
+        assert len(handles) > 0
+    assert len(table._file_pool) == 0 and not any(handles.values())
+
+
+def test_batch_cache():
+    from astro_plasma.core.batch_cache import BatchCache
+    import numpy as np
+
+    cache = BatchCache(max_bytes=3 * 800)
+    for batch_id in range(3):
+        cache.put(("ionization", "output/fracIon/PIE", batch_id), np.full(100, batch_id, dtype=np.float64))
+    assert cache.get(("ionization", "output/fracIon/PIE", 0))[0] == 0
+    assert cache.get(("ionization", "output/fracIon/CIE", 0)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # batch 1 is now the least recently used entry
+    cache.put(("ionization", "output/fracIon/PIE", 3), np.full(100, 3, dtype=np.float64))
+    assert ("ionization", "output/fracIon/PIE", 1) not in cache
+    assert cache.evictions == 1 and cache.nbytes <= cache.max_bytes
+
+    # larger than the whole budget
+    cache.put(("emission", "output/emission/PIE/total", 0), np.zeros(1000))
+    assert ("emission", "output/emission/PIE/total", 0) not in cache
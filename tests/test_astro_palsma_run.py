@@ -154,6 +154,33 @@ def test_mu():
     assert np.isclose(mu_i, mu_i_expected)
 
 
+def test_plasma_state():
+    # Import AstroPlasma Ionization module
+    from astro_plasma import Ionization
+    from astro_plasma.core.constants import mH, mp, Xp
+    import numpy as np
+
+    nH = 1.2e-04  # Hydrogen number density in cm^-3
+    temperature = 4.2e05  # Temperature of the plasma in kelvin
+    metallicity = 0.99  # Metallicity of plasma with respect to solar
+    redshift = 0.001  # Cosmological redshift
+    mode = "CIE"
+
+    state = Ionization.interpolate_plasma_state(
+        nH=nH,
+        temperature=temperature,
+        metallicity=metallicity,
+        redshift=redshift,
+        mode=mode,
+    )
+    mu_expected = 0.6181703336141905
+    assert np.isclose(state.mu, mu_expected)
+    mu_e_expected = 1.1893028977102762
+    assert np.isclose(state.ne, nH * (mH / mp) / (Xp(metallicity) * mu_e_expected))
+    mu_i_expected = 1.2821130218010255
+    assert np.isclose(state.ni, nH * (mH / mp) / (Xp(metallicity) * mu_i_expected))
+
+
 def test_spectrum():
     # Import AstroPlasma EmissionSpectrum module
     from astro_plasma import EmissionSpectrum